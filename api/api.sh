@@ -44,6 +44,8 @@ start_service() {
     cd "$APP_DIR"
     
     # 启动服务
+    # uvicorn 默认 --loop auto / --http auto：环境中安装了 uvloop 与 httptools 时会自动启用，
+    # 不在此处显式指定，避免缺少这两个包时服务无法启动
     nohup /bin/bash -c "
         source /home/ps/anaconda3/bin/activate $CONDA_ENV;
         uvicorn main_sse:app --host 0.0.0.0 --port $PORT --workers $WORKERS
@@ -70,6 +70,9 @@ class Config:
         self.secret_key = get_env_or_default('SECRET_KEY', 'your-secret-key-change-in-production')
         self.allowed_hosts = get_env_or_default('ALLOWED_HOSTS', '*').split(',')
         
+        # 频率限制配置（设置后多个 worker 通过 Redis 共享计数，未设置则使用进程内计数）
+        self.rate_limit_redis_url = get_env_or_default('RATE_LIMIT_REDIS_URL', '')
+        
         # 文件上传配置
         self.max_upload_size = int(get_env_or_default('MAX_UPLOAD_SIZE', str(50 * 1024 * 1024)))  # 50MB
         self.upload_dir = get_env_or_default('UPLOAD_DIR', 'uploads')
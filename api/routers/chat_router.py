@@ -100,7 +100,7 @@ async def get_chat_history(
         if not session_data:
             raise HTTPException(status_code=404, detail="Session not found")
         
-        messages = session_data.get("messages", [])
+        messages = list(session_data.get("messages", ()))
         return {
             "session_id": session_id,
             "messages": messages,
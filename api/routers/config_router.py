@@ -46,7 +46,7 @@ async def get_session_config(session_id: str):
         if config is None:
             raise HTTPException(status_code=404, detail="会话不存在")
         
-        return {"success": True, "config": config}
+        return {"success": True, "config": dict(config)}
     except Exception as e:
         logger.error(f"获取会话配置失败: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -52,7 +52,7 @@ async def create_session(
         safe_session_data = {
             "session_id": session_id,
             "conversation_id": session_data["conversation_id"],
-            "created_at": session_data["created_at"],
+            "created_at": session_data["created_at"].isoformat(),
             "status": session_data["status"]
         }
         await sse_service.send_message(session_id, SSEMessageType.SESSION_CREATED, safe_session_data)
@@ -63,7 +63,7 @@ async def create_session(
         return SessionResponse(
             session_id=session_id,
             conversation_id=session_data["conversation_id"],
-            created_at=session_data["created_at"]
+            created_at=session_data["created_at"].isoformat()
         )
     except HTTPException:
         raise
@@ -96,8 +96,8 @@ async def get_session(
         safe_data = {
             "session_id": session_id,
             "conversation_id": session_data["conversation_id"],
-            "created_at": session_data["created_at"],
-            "last_activity": session_data.get("last_activity"),
+            "created_at": session_data["created_at"].isoformat(),
+            "last_activity": datetime.fromtimestamp(session_data["last_activity"]).isoformat(),
             "status": session_data.get("status"),
             "message_count": len(session_data.get("messages", []))
         }
@@ -190,7 +190,6 @@ class ChatService:
                 except Exception as e:
                     logger.error(f"[{session_id}] 清理事件处理器失败: {e}")
             
-            self._active_tasks.pop(task_id, None)
             logger.info(f"[{session_id}] 消息处理完成，资源已清理")
 
     async def _execute_taskweaver_task(self, taskweaver_session, prompt: str, 
@@ -218,7 +217,7 @@ class ChatService:
             )
         )
         
-        self._active_tasks[task_id] = task
+        self._track_task(task_id, task)
         
         try:
             return await task
@@ -229,8 +228,21 @@ class ChatService:
             logger.error(f"TaskWeaver任务超时: {task_id}")
             task.cancel()  # 取消任务
             raise
-        finally:
-            self._active_tasks.pop(task_id, None)
+
+    def _track_task(self, task_id: str, task: asyncio.Task) -> None:
+        """登记活跃任务，任务结束时由回调自动移除（无需周期性扫描）"""
+        self._active_tasks[task_id] = task
+
+        def _on_done(done_task: asyncio.Task) -> None:
+            if self._active_tasks.get(task_id) is done_task:
+                del self._active_tasks[task_id]
+            # 读取异常（同时避免 "exception was never retrieved" 警告），调用方会另行处理
+            if not done_task.cancelled():
+                exc = done_task.exception()
+                if exc is not None:
+                    logger.debug(f"任务 {task_id} 异常结束: {exc!r}")
+
+        task.add_done_callback(_on_done)
 
     async def _build_prompt(self, message: ChatMessage, session_id: str) -> str:
         """构建提示词"""
@@ -479,7 +491,7 @@ class ChatService:
         # 等待所有任务完成或取消
         if self._active_tasks:
             await asyncio.gather(
-                *self._active_tasks.values(),
+                *list(self._active_tasks.values()),
                 return_exceptions=True
             )
         # 关闭线程池
@@ -35,7 +35,7 @@ class ConfigService:
     
     def _mask_sensitive_config(self, config: Dict[str, Any]) -> Dict[str, Any]:
         """掩码敏感配置信息"""
-        masked_config = copy.deepcopy(config)
+        masked_config = copy.deepcopy(dict(config))
         sensitive_keys = ["llm.api_key", "api_key", "secret", "password", "token"]
         
         for key in sensitive_keys:
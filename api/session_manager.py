@@ -5,64 +5,250 @@ import shutil
 import os
 import psutil
 import gc
-from typing import Dict, Optional, List
-from datetime import datetime, timedelta
+import time
+from typing import Dict, Optional, List, Mapping, Set
+from datetime import datetime
 from taskweaver.session.session import Session
 from taskweaver.app.app import TaskWeaverApp
 import copy
-from collections import OrderedDict
+import types
+from collections import OrderedDict, defaultdict, deque
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 
 logger = logging.getLogger(__name__)
 
+# 默认配置模板：模块加载时构建一次（只读），创建会话时由 _new_session_config 复制出会话私有配置
+_DEFAULT_CONFIG = types.MappingProxyType({
+    "llm.api_type": "lingyun",
+    "llm.model": "qwen2.5-32b",
+    "execution_service.kernel_mode": "local",
+    "code_generator.enable_auto_plugin_selection": "false",
+    "code_generator.allowed_plugins": ["sql_pull_data"],  # 添加插件过滤配置
+    "code_interpreter.code_verification_on": "false",
+    "code_interpreter.allowed_modules": ["pandas", "matplotlib", "numpy", "sklearn", "scipy", "seaborn", "datetime", "typing", "json"],
+    "logging.log_file": "taskweaver.log",
+    "logging.log_folder": "logs",
+    "logging.log_level": "WARNING",
+    "planner.prompt_compression": "true",
+    "code_generator.prompt_compression": "true",
+    "session.max_internal_chat_round_num": 20,
+    "session.roles": ["planner", "code_interpreter", "recepta"]
+})
+
+
+def _freeze_config(config: Mapping) -> Mapping:
+    """构建配置的只读视图（列表转为元组），供 get_session_config 直接返回"""
+    return types.MappingProxyType({
+        k: tuple(v) if isinstance(v, list) else v
+        for k, v in config.items()
+    })
+
+
+_DEFAULT_CONFIG_VIEW = _freeze_config(_DEFAULT_CONFIG)
+
+
+def _new_session_config(custom_config: Optional[Mapping] = None) -> Dict:
+    """基于默认配置构建会话私有的配置字典
+
+    列表值逐个复制：TaskWeaver 不接受元组，而共享同一列表对象时，
+    任一会话对其原地修改都会影响所有会话。
+    """
+    session_config = {
+        k: list(v) if isinstance(v, list) else v
+        for k, v in _DEFAULT_CONFIG.items()
+    }
+    if custom_config:
+        session_config.update(custom_config)
+    return session_config
+
+# TaskWeaver 会话/应用清理时可能调用的方法名；按类型缓存探测结果，避免每次清理重复 hasattr
+_CLEANUP_METHODS = ("stop", "close", "clear", "cleanup", "shutdown", "clear_cache")
+_CAPS_CACHE: Dict[type, frozenset] = {}
+
+
+def _caps(obj) -> frozenset:
+    """返回对象所属类型上定义的清理方法名集合（每个类型只探测一次）"""
+    cls = type(obj)
+    caps = _CAPS_CACHE.get(cls)
+    if caps is None:
+        caps = frozenset(name for name in _CLEANUP_METHODS if callable(getattr(cls, name, None)))
+        _CAPS_CACHE[cls] = caps
+    return caps
+
 class MemoryMonitor:
-    """内存监控器"""
-    
+    """内存监控器（在 min_interval 秒内复用上一次的读数，减少 psutil 系统调用）"""
+
+    def __init__(self, min_interval: float = 1.0):
+        self.min_interval = min_interval
+        self._cache: Dict[str, tuple] = {}  # 读数类型 -> (monotonic 时间戳, 读数)
+        self._cache_lock = threading.Lock()
+
+    def _cached(self, key: str, reader, force_refresh: bool = False) -> Dict[str, float]:
+        now = time.monotonic()
+        with self._cache_lock:
+            entry = self._cache.get(key)
+            if not force_refresh and entry and now - entry[0] < self.min_interval:
+                return entry[1]
+        value = reader()
+        with self._cache_lock:
+            self._cache[key] = (now, value)
+        return value
+
     @staticmethod
-    def get_memory_usage() -> Dict[str, float]:
-        """获取当前内存使用情况"""
+    def _read_process_memory() -> Dict[str, float]:
         try:
             process = psutil.Process()
-            memory_info = process.memory_info()
-            memory_percent = process.memory_percent()
+            # oneshot 让 psutil 一次性读取 /proc 数据供多个查询复用
+            with process.oneshot():
+                memory_info = process.memory_info()
+                memory_percent = process.memory_percent()
             
             return {
                 "rss_mb": memory_info.rss / 1024 / 1024,  # 物理内存
                 "vms_mb": memory_info.vms / 1024 / 1024,  # 虚拟内存
-                "percent": memory_percent,
-                "available_mb": psutil.virtual_memory().available / 1024 / 1024
+                "percent": memory_percent
             }
         except Exception as e:
-            logger.error(f"获取内存信息失败: {e}")
+            logger.error(f"获取进程内存信息失败: {e}")
             return {
                 "rss_mb": 0,
                 "vms_mb": 0,
-                "percent": 0,
-                "available_mb": 0
+                "percent": 0
             }
-    
+
     @staticmethod
-    def is_memory_pressure(threshold_percent: float = 80.0) -> bool:
+    def _read_system_memory() -> Dict[str, float]:
+        try:
+            return {"available_mb": psutil.virtual_memory().available / 1024 / 1024}
+        except Exception as e:
+            logger.error(f"获取系统内存信息失败: {e}")
+            return {"available_mb": 0}
+
+    def get_process_memory(self, force_refresh: bool = False) -> Dict[str, float]:
+        """获取当前进程的内存使用情况（不查询系统内存）"""
+        return self._cached("process", self._read_process_memory, force_refresh)
+
+    def get_system_memory(self, force_refresh: bool = False) -> Dict[str, float]:
+        """获取系统可用内存"""
+        return self._cached("system", self._read_system_memory, force_refresh)
+
+    def get_memory_usage(self, force_refresh: bool = False) -> Dict[str, float]:
+        """获取当前内存使用情况（进程 + 系统）"""
+        return {
+            **self.get_process_memory(force_refresh),
+            **self.get_system_memory(force_refresh)
+        }
+    
+    def is_memory_pressure(self, threshold_percent: float = 80.0) -> bool:
         """检查是否存在内存压力"""
-        memory_info = MemoryMonitor.get_memory_usage()
+        memory_info = self.get_process_memory()
         return memory_info["percent"] > threshold_percent
 
+class ReadWriteLock:
+    """读写锁：读操作可并发，写操作独占
+
+    写者优先：有写者排队时新的读者等待，避免持续的读请求让写者饥饿。
+    同一线程内读锁、写锁均可重入，持有写锁时可再获取读锁；
+    持有读锁时获取写锁（读锁升级）会直接抛出 RuntimeError，而不是死锁。
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers: Dict[int, int] = {}  # 持有读锁的线程ID -> 重入深度
+        self._writer: Optional[int] = None
+        self._write_depth = 0
+        self._waiting_writers = 0
+
+    @contextmanager
+    def read_lock(self):
+        me = threading.get_ident()
+        with self._cond:
+            # 持有写锁的线程内的读操作直接放行
+            nested = self._writer == me
+            if not nested:
+                depth = self._readers.get(me, 0)
+                # 已持有读锁的线程重入时不排队，否则会与等待中的写者互相等待
+                if depth == 0:
+                    while self._writer is not None or self._waiting_writers:
+                        self._cond.wait()
+                self._readers[me] = depth + 1
+        try:
+            yield
+        finally:
+            if not nested:
+                with self._cond:
+                    depth = self._readers[me] - 1
+                    if depth:
+                        self._readers[me] = depth
+                    else:
+                        del self._readers[me]
+                        if not self._readers:
+                            self._cond.notify_all()
+
+    @contextmanager
+    def write_lock(self):
+        me = threading.get_ident()
+        with self._cond:
+            if self._writer == me:
+                self._write_depth += 1
+            else:
+                if me in self._readers:
+                    raise RuntimeError("不支持在持有读锁时获取写锁")
+                self._waiting_writers += 1
+                try:
+                    while self._writer is not None or self._readers:
+                        self._cond.wait()
+                finally:
+                    self._waiting_writers -= 1
+                self._writer = me
+                self._write_depth = 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._write_depth -= 1
+                if self._write_depth == 0:
+                    self._writer = None
+                    self._cond.notify_all()
+
 class SessionManager:
+    default_config = _DEFAULT_CONFIG
+
+    # 无锁快速路径积累的待处理访问超过该数量时，立即持写锁应用一次
+    PENDING_TOUCH_LIMIT = 256
+
     def __init__(self,
                  cleanup_interval_minutes: int = 60,  # 缩短清理间隔
                  max_sessions: int = 10,  # 最大会话数限制
                  memory_threshold_percent: float = 80.0,  # 内存压力阈值
-                 force_cleanup_threshold_percent: float = 90.0):  # 强制清理阈值
+                 force_cleanup_threshold_percent: float = 90.0,  # 强制清理阈值
+                 max_messages_per_session: int = 500,  # 每个会话保留的消息条数上限
+                 memory_sample_interval: float = 1.0):  # 内存读数缓存时间（秒）
         
         self.sessions: OrderedDict[str, Dict] = OrderedDict()  # 使用OrderedDict支持LRU
+        self._heartbeats: OrderedDict[str, float] = OrderedDict()  # 按心跳时间（epoch 秒）排序
         self.conversation_ids: Dict[str, str] = {}
+        self._ip_index: Dict[str, Set[str]] = defaultdict(set)  # client_ip -> 会话ID集合
+        # 无锁快速路径访问过、尚未调整 LRU 位置的会话ID（按最近访问排序、去重，值无意义）
+        self._pending_touches: OrderedDict[str, None] = OrderedDict()
+        self._active_count = 0  # status == "active" 的会话数，随状态变化增量维护
         self.cleanup_interval_minutes = cleanup_interval_minutes
         self.max_sessions = max_sessions
         self.memory_threshold_percent = memory_threshold_percent
         self.force_cleanup_threshold_percent = force_cleanup_threshold_percent
+        self.max_messages_per_session = max_messages_per_session
         
-        self._lock = threading.RLock()
-        self._cleanup_timer: Optional[threading.Timer] = None
-        self._memory_monitor = MemoryMonitor()
+        self._lock = ReadWriteLock()  # 统计/列表等只读操作不再阻塞清理
+        self._stop_evt = threading.Event()
+        self._worker: Optional[threading.Thread] = None
+        self._memory_monitor = MemoryMonitor(min_interval=memory_sample_interval)
+        self._safe_base: Optional[str] = None  # 工作空间安全根目录（首次使用时解析）
+
+        # 自适应清理间隔（秒）：内存紧张时缩短，平稳后逐步恢复
+        self._base_interval = cleanup_interval_minutes * 60
+        self._current_interval = self._base_interval
+        self._calm_ticks = 0
         
         # 统计信息
         self._stats = {
@@ -72,60 +258,31 @@ class SessionManager:
             "force_cleanups": 0
         }
         
-        self._start_cleanup_timer()
-        
-        # 默认配置模板
-        # self.default_config = {
-        #     "llm.api_type": "qwen",
-        #     "llm.model": "qwen3-14b",
-        #     "execution_service.kernel_mode": "local",
-        #     "code_generator.enable_auto_plugin_selection": "false",
-        #     "code_generator.allowed_plugins": ["sql_pull_data"],  # 添加插件过滤配置
-        #     "code_interpreter.code_verification_on": "false",
-        #     "code_interpreter.allowed_modules": ["pandas", "matplotlib", "numpy", "sklearn", "scipy", "seaborn", "datetime", "typing", "json"],
-        #     "logging.log_file": "taskweaver.log",
-        #     "logging.log_folder": "logs",
-        #     "logging.log_level": "WARNING",
-        #     "planner.prompt_compression": "true",
-        #     "code_generator.prompt_compression": "true",
-        #     "session.max_internal_chat_round_num": 20,
-        #     "session.roles": ["planner", "code_interpreter", "recepta"]
-        # }
-        self.default_config = {
-            "llm.api_type": "lingyun",
-            "llm.model": "qwen2.5-32b",
-            "execution_service.kernel_mode": "local",
-            "code_generator.enable_auto_plugin_selection": "false",
-            "code_generator.allowed_plugins": ["sql_pull_data"],  # 添加插件过滤配置
-            "code_interpreter.code_verification_on": "false",
-            "code_interpreter.allowed_modules": ["pandas", "matplotlib", "numpy", "sklearn", "scipy", "seaborn", "datetime", "typing", "json"],
-            "logging.log_file": "taskweaver.log",
-            "logging.log_folder": "logs",
-            "logging.log_level": "WARNING",
-            "planner.prompt_compression": "true",
-            "code_generator.prompt_compression": "true",
-            "session.max_internal_chat_round_num": 20,
-            "session.roles": ["planner", "code_interpreter", "recepta"]
-        }
-        
-    def _start_cleanup_timer(self):
-        """启动定时清理任务"""
-        if self._cleanup_timer:
-            self._cleanup_timer.cancel()
+        self._start_cleanup_worker()
         
-        self._cleanup_timer = threading.Timer(
-            self.cleanup_interval_minutes * 60,
-            self._periodic_cleanup
+    def _start_cleanup_worker(self):
+        """启动常驻的后台清理线程（整个生命周期只创建一个线程）"""
+        self._worker = threading.Thread(
+            target=self._cleanup_loop,
+            name="session-cleanup",
+            daemon=True
         )
-        self._cleanup_timer.daemon = True
-        self._cleanup_timer.start()
+        self._worker.start()
+
+    def _cleanup_loop(self):
+        """等待清理间隔或停止信号，超时则执行一次定期清理"""
+        while not self._stop_evt.wait(self._current_interval):
+            self._periodic_cleanup()
         
     def _periodic_cleanup(self):
         """定期清理非活跃会话和内存监控"""
         try:
-            # 检查内存使用情况
-            memory_info = self._memory_monitor.get_memory_usage()
-            logger.info(f"内存使用情况: {memory_info}")
+            # 本轮清理统一使用同一个时间戳
+            now = time.time()
+
+            # 检查内存使用情况（只需进程级数据）
+            memory_info = self._memory_monitor.get_process_memory()
+            logger.info("内存使用情况: %s", memory_info)
             
             # 根据内存压力调整清理策略
             if memory_info["percent"] > self.force_cleanup_threshold_percent:
@@ -133,147 +290,209 @@ class SessionManager:
                 self._force_cleanup()
                 self._stats["force_cleanups"] += 1
             elif memory_info["percent"] > self.memory_threshold_percent:
-                logger.info(f"内存压力较大 ({memory_info['percent']:.1f}%)，执行积极清理")
-                self._aggressive_cleanup()
+                logger.info("内存压力较大 (%.1f%%)，执行积极清理", memory_info['percent'])
+                self._aggressive_cleanup(now)
                 self._stats["memory_cleanups"] += 1
             else:
                 # 正常清理
-                self.cleanup_inactive_sessions(self.cleanup_interval_minutes)
-            
-            # 强制垃圾回收
-            gc.collect()
+                self.cleanup_inactive_sessions(self.cleanup_interval_minutes, now=now)
+
+            # 仅在存在内存压力时执行一次完整垃圾回收
+            if memory_info["percent"] > self.memory_threshold_percent:
+                gc.collect(generation=2)
+
+            self._adjust_cleanup_interval(memory_info["percent"])
             
         except Exception as e:
             logger.error(f"定期清理会话失败: {e}")
-        finally:
-            self._start_cleanup_timer()
+
+    def _adjust_cleanup_interval(self, memory_percent: float, min_interval: float = 30.0):
+        """根据内存压力调整下一次清理的等待时间"""
+        if memory_percent > self.force_cleanup_threshold_percent:
+            # 内存紧张：间隔减半，加快清理频率
+            self._calm_ticks = 0
+            self._current_interval = max(min_interval, self._current_interval / 2)
+        elif memory_percent <= self.memory_threshold_percent:
+            # 连续两次无内存压力：间隔加倍，直到恢复为初始间隔
+            self._calm_ticks += 1
+            if self._calm_ticks >= 2:
+                self._calm_ticks = 0
+                self._current_interval = min(self._base_interval, self._current_interval * 2)
+        else:
+            self._calm_ticks = 0
     
     def _force_cleanup(self):
         """强制清理 - 清理最老的会话直到内存使用降低"""
-        with self._lock:
+        with self._lock.write_lock():
+            self._apply_pending_touches()
             initial_count = len(self.sessions)
             target_count = max(1, initial_count // 2)  # 清理一半会话
             
-            # 按最后活动时间排序，清理最老的会话
-            sessions_by_activity = sorted(
-                self.sessions.items(),
-                key=lambda x: x[1].get("last_activity", datetime.min)
-            )
-            
-            cleaned_count = 0
-            for session_id, _ in sessions_by_activity:
-                if len(self.sessions) <= target_count:
-                    break
-                    
-                self.delete_session(session_id)
-                cleaned_count += 1
-            
-            logger.warning(f"强制清理完成，清理了 {cleaned_count} 个会话")
-            self._stats["total_cleaned"] += cleaned_count
+            # OrderedDict 按最后活动时间排序，前面的是最老的会话
+            victims = []
+            while len(self.sessions) > target_count:
+                session_id, session_data = self.sessions.popitem(last=False)
+                self._unindex_session(session_id, session_data)
+                victims.append((session_id, session_data))
+
+        # 以下清理不再持有锁：TaskWeaver 会话串行停止，工作空间并行删除
+        for _, session_data in victims:
+            self._cleanup_taskweaver_session(session_data)
+
+        workspace_paths = [
+            session_data["workspace_path"]
+            for _, session_data in victims
+            if session_data.get("workspace_path")
+        ]
+        if workspace_paths:
+            with ThreadPoolExecutor(max_workers=4) as executor:
+                list(executor.map(self._cleanup_workspace, workspace_paths))
+
+        cleaned_count = len(victims)
+        for session_id, _ in victims:
+            logger.info("Deleted session: %s", session_id)
+        logger.warning(f"强制清理完成，清理了 {cleaned_count} 个会话")
+        self._stats["total_cleaned"] += cleaned_count
     
-    def _aggressive_cleanup(self):
+    def _aggressive_cleanup(self, now: Optional[float] = None):
         """积极清理 - 使用更短的超时时间"""
         # 使用更短的超时时间进行清理
         short_timeout = max(5, self.cleanup_interval_minutes // 2)
-        cleaned = self.cleanup_inactive_sessions(short_timeout)
+        cleaned = self.cleanup_inactive_sessions(short_timeout, now=now)
         
         # 如果清理的会话不够，进一步清理
         if cleaned < 3 and len(self.sessions) > self.max_sessions // 2:
             self._cleanup_lru_sessions(3)
+
+        # 内存压力下收紧剩余会话的消息历史
+        self._shrink_message_history()
+
+    def _shrink_message_history(self, min_keep: int = 50):
+        """丢弃各会话最早的消息，只保留上限的一半（不少于 min_keep 条）
+
+        只裁剪现有消息、不修改 deque 的 maxlen，内存压力解除后会话仍可恢复到配置的上限。
+        """
+        with self._lock.write_lock():
+            for session_data in self.sessions.values():
+                messages = session_data["messages"]
+                keep = max(min_keep, messages.maxlen // 2)
+                for _ in range(len(messages) - keep):
+                    messages.popleft()
     
     def _cleanup_lru_sessions(self, count: int):
         """清理最近最少使用的会话"""
-        with self._lock:
-            if len(self.sessions) <= count:
-                return
-            
-            # OrderedDict的前面是最老的
-            sessions_to_remove = list(self.sessions.keys())[:count]
-            
-            for session_id in sessions_to_remove:
-                self.delete_session(session_id)
-                logger.info(f"LRU清理会话: {session_id}")
-            
-            self._stats["total_cleaned"] += len(sessions_to_remove)
+        with self._lock.write_lock():
+            victims = self._detach_lru_sessions(count)
+        self._destroy_detached(victims)
+
+    def _detach_lru_sessions(self, count: int) -> List[tuple]:
+        """摘除最近最少使用的会话，返回 (session_id, session_data) 列表（调用方需持有写锁）"""
+        self._apply_pending_touches()
+        if len(self.sessions) <= count:
+            return []
+
+        # OrderedDict的前面是最老的，直接从队首弹出
+        victims = []
+        for _ in range(count):
+            session_id, session_data = self.sessions.popitem(last=False)
+            self._unindex_session(session_id, session_data)
+            victims.append((session_id, session_data))
+            logger.info("LRU清理会话: %s", session_id)
+
+        self._stats["total_cleaned"] += len(victims)
+        return victims
     
-    def _enforce_session_limit(self):
-        """强制执行会话数量限制"""
-        with self._lock:
-            if len(self.sessions) >= self.max_sessions:
-                excess_count = len(self.sessions) - self.max_sessions + 1
-                self._cleanup_lru_sessions(excess_count)
-                logger.info(f"会话数量超限，清理了 {excess_count} 个最老会话")
+    def _enforce_session_limit(self) -> List[tuple]:
+        """强制执行会话数量限制，返回被摘除、待释放资源的会话（调用方需持有写锁）"""
+        if len(self.sessions) >= self.max_sessions:
+            excess_count = len(self.sessions) - self.max_sessions + 1
+            victims = self._detach_lru_sessions(excess_count)
+            logger.info("会话数量超限，清理了 %s 个最老会话", excess_count)
+            return victims
+        return []
         
     def create_session(self, session_id: str = None, custom_config: Dict = None) -> str:
         """创建新会话，支持自定义配置和会话数量限制"""
         if session_id is None:
             session_id = str(uuid.uuid4())
             
-        with self._lock:
-            # 检查会话数量限制
-            self._enforce_session_limit()
+        victims = []
+        try:
+            with self._lock.write_lock():
+                # 检查会话数量限制（被淘汰会话的资源在释放锁之后再清理）
+                victims = self._enforce_session_limit()
             
-            if session_id in self.sessions:
-                logger.warning(f"Session {session_id} already exists")
-                # 移动到末尾（LRU更新）
-                self.sessions.move_to_end(session_id)
-                return session_id
+                if session_id in self.sessions:
+                    logger.warning(f"Session {session_id} already exists")
+                    # 移动到末尾（LRU更新）
+                    self.sessions[session_id]["last_activity"] = time.time()
+                    self.sessions.move_to_end(session_id)
+                    return session_id
     
-            try:
-                conversation_id = str(uuid.uuid4())
-                created_at = datetime.now()
+                try:
+                    conversation_id = str(uuid.uuid4())
+                    created_at = datetime.now()
+                    now = created_at.timestamp()
                 
-                # 提取元信息（不要混入 TaskWeaver 的 session_config）
-                meta = {}
-                if custom_config:
-                    # 拷贝避免修改调用方传入对象
-                    cfg_copy = copy.deepcopy(custom_config)
-                    for k in ["client_ip", "user_agent", "is_admin_session", "created_by"]:
-                        if k in cfg_copy:
-                            meta[k] = cfg_copy.pop(k)
-                    custom_config = cfg_copy  # 剩余才是真正的 TaskWeaver 配置
-
-                # 合并默认配置和自定义配置
-                session_config = copy.deepcopy(self.default_config)
-                if custom_config:
-                    session_config.update(custom_config)
+                    # 提取元信息（不要混入 TaskWeaver 的 session_config）
+                    meta = {}
+                    if custom_config:
+                        # 拷贝避免修改调用方传入对象
+                        cfg_copy = copy.deepcopy(custom_config)
+                        for k in ["client_ip", "user_agent", "is_admin_session", "created_by"]:
+                            if k in cfg_copy:
+                                meta[k] = cfg_copy.pop(k)
+                        custom_config = cfg_copy  # 剩余才是真正的 TaskWeaver 配置
+
+                    # 合并默认配置和自定义配置（custom_config 已深拷贝，只需复制默认配置中的列表）
+                    session_config = _new_session_config(custom_config)
     
-                session_data = {
-                    "conversation_id": conversation_id,
-                    "taskweaver_session": None,
-                    "taskweaver_app": None,
-                    "messages": [],
-                    "created_at": created_at.isoformat(),
-                    "last_activity": created_at,
-                    "status": "active",
-                    "client_ip": meta.get("client_ip"),
-                    "user_agent": meta.get("user_agent"),
-                    "is_admin_session": bool(meta.get("is_admin_session", False)),
-                    "created_by": meta.get("created_by"),
-                    "last_heartbeat": created_at,
-                    "workspace_path": None,
-                    "session_config": session_config,
-                    "memory_usage": 0,  # 跟踪内存使用
-                    "resource_count": 0  # 跟踪资源数量
-                }
+                    session_data = {
+                        "conversation_id": conversation_id,
+                        "taskweaver_session": None,
+                        "taskweaver_app": None,
+                        "messages": deque(maxlen=self.max_messages_per_session),  # 超出上限时丢弃最早的消息
+                        "created_at": created_at,
+                        "last_activity": now,  # epoch 秒，仅在 API 层转换为 ISO 字符串
+                        "status": "active",
+                        "client_ip": meta.get("client_ip"),
+                        "user_agent": meta.get("user_agent"),
+                        "is_admin_session": bool(meta.get("is_admin_session", False)),
+                        "created_by": meta.get("created_by"),
+                        "last_heartbeat": now,
+                        "workspace_path": None,
+                        "session_config": session_config,
+                        "_config_view": (
+                            _freeze_config(session_config) if custom_config
+                            else _DEFAULT_CONFIG_VIEW
+                        ),
+                        "memory_usage": 0,  # 跟踪内存使用
+                        "resource_count": 0  # 跟踪资源数量
+                    }
                 
-                self.sessions[session_id] = session_data
-                self.conversation_ids[session_id] = conversation_id
+                    self.sessions[session_id] = session_data
+                    self._heartbeats[session_id] = now
+                    self.conversation_ids[session_id] = conversation_id
+                    self._active_count += 1
+                    if session_data["client_ip"]:
+                        self._ip_index[session_data["client_ip"]].add(session_id)
                 
-                # 移除弱引用相关代码，因为dict不支持弱引用
-                # self._session_refs[session_id] = weakref.ref(session_data)  # 删除这行
+                    # 移除弱引用相关代码，因为dict不支持弱引用
+                    # self._session_refs[session_id] = weakref.ref(session_data)  # 删除这行
                 
-                self._stats["total_created"] += 1
-                logger.info(f"Created session: {session_id} with conversation: {conversation_id}")
-                return session_id
+                    self._stats["total_created"] += 1
+                    logger.info("Created session: %s with conversation: %s", session_id, conversation_id)
+                    return session_id
                 
-            except Exception as e:
-                logger.error(f"Failed to create session {session_id}: {e}")
-                raise
+                except Exception as e:
+                    logger.error(f"Failed to create session {session_id}: {e}")
+                    raise
+        finally:
+            self._destroy_detached(victims)
 
     def update_session_config(self, session_id: str, new_config: Dict) -> bool:
         """更新会话配置并重建TaskWeaver会话"""
-        with self._lock:
+        with self._lock.write_lock():
             if session_id not in self.sessions:
                 return False
             
@@ -281,12 +500,13 @@ class SessionManager:
             
             # 更新配置
             session_data["session_config"].update(new_config)
+            session_data["_config_view"] = _freeze_config(session_data["session_config"])
             
             # 清理现有的TaskWeaver会话，强制重建
             if "taskweaver_session" in session_data:
                 try:
                     taskweaver_session = session_data["taskweaver_session"]
-                    if taskweaver_session and hasattr(taskweaver_session, 'stop'):
+                    if taskweaver_session and 'stop' in _caps(taskweaver_session):
                         taskweaver_session.stop()
                 except Exception as e:
                     logger.error(f"停止TaskWeaver会话失败: {e}")
@@ -294,19 +514,20 @@ class SessionManager:
                 session_data["taskweaver_session"] = None
                 session_data["taskweaver_app"] = None
             
-            logger.info(f"会话 {session_id} 配置已更新，将在下次使用时重建TaskWeaver会话")
+            logger.info("会话 %s 配置已更新，将在下次使用时重建TaskWeaver会话", session_id)
             return True
     
-    def get_session_config(self, session_id: str) -> Optional[Dict]:
-        """获取会话的配置"""
-        with self._lock:
-            if session_id not in self.sessions:
+    def get_session_config(self, session_id: str) -> Optional[Mapping]:
+        """获取会话配置的只读视图（不复制；修改请使用 update_session_config）"""
+        with self._lock.read_lock():
+            session_data = self.sessions.get(session_id)
+            if session_data is None:
                 return None
-            return self.sessions[session_id].get("session_config", {})
+            return session_data["_config_view"]
     
     def create_taskweaver_app_for_session(self, session_id: str, base_taskweaver_app) -> Optional[object]:
         """为会话创建专用的TaskWeaver应用实例"""
-        with self._lock:
+        with self._lock.write_lock():
             if session_id not in self.sessions:
                 return None
             
@@ -324,31 +545,70 @@ class SessionManager:
 
     def get_session(self, session_id: str) -> Optional[Dict]:
         """获取指定的会话（LRU更新）"""
-        with self._lock:
+        with self._lock.write_lock():
+            self._apply_pending_touches()
             if session_id not in self.sessions:
                 return None
             
             # 更新最后活动时间和LRU位置
-            self.sessions[session_id]["last_activity"] = datetime.now()
+            self.sessions[session_id]["last_activity"] = time.time()
             self.sessions.move_to_end(session_id)  # 移动到末尾
             return self.sessions[session_id]
 
     def get_or_create_session(self, session_id: str, custom_config: Dict = None) -> Dict:
-        with self._lock:
+        # 快速路径：会话已存在时只持有读锁（读者之间互不阻塞），
+        # LRU 位置调整记入 _pending_touches，由下一次持有写锁的操作统一处理。
+        # 读锁保证查找与登记期间清理操作不会摘除该会话或应用待处理访问
+        touches = self._pending_touches
+        with self._lock.read_lock():
             session = self.sessions.get(session_id)
-            if session:
-                session["last_activity"] = datetime.now()
-                return session
+            if session is not None:
+                touches.pop(session_id, None)  # 重新插入到末尾，保持按访问先后排序
+                touches[session_id] = None
+                session["last_activity"] = time.time()
+        if session is not None:
+            if len(touches) > self.PENDING_TOUCH_LIMIT:
+                with self._lock.write_lock():
+                    self._apply_pending_touches()
+            return session
 
-            self.create_session(session_id, custom_config)
+        self.create_session(session_id, custom_config)
+        with self._lock.read_lock():
             return self.sessions.get(session_id)
 
+    def _apply_pending_touches(self) -> None:
+        """把无锁快速路径记录的访问应用到 LRU 顺序（调用方需持有写锁）"""
+        touches = self._pending_touches
+        while touches:
+            session_id, _ = touches.popitem(last=False)
+            if session_id in self.sessions:
+                self.sessions.move_to_end(session_id)
+
+    def set_session_status(self, session_id: str, status: str) -> bool:
+        """更新会话状态并同步活跃会话计数"""
+        with self._lock.write_lock():
+            session_data = self.sessions.get(session_id)
+            if session_data is None:
+                return False
+
+            old_status = session_data.get("status")
+            if old_status != status:
+                if old_status == "active":
+                    self._active_count -= 1
+                elif status == "active":
+                    self._active_count += 1
+                session_data["status"] = status
+            return True
+
     def update_heartbeat(self, session_id: str) -> bool:
         """更新会话的心跳时间"""
-        with self._lock:
+        with self._lock.write_lock():
             if session_id in self.sessions:
-                self.sessions[session_id]["last_heartbeat"] = datetime.now()
-                logger.debug(f"Heartbeat updated for session: {session_id}")
+                now = time.time()
+                self.sessions[session_id]["last_heartbeat"] = now
+                self._heartbeats[session_id] = now
+                self._heartbeats.move_to_end(session_id)
+                logger.debug("Heartbeat updated for session: %s", session_id)
                 return True
             return False
 
@@ -359,20 +619,21 @@ class SessionManager:
             taskweaver_app = session_data.get("taskweaver_app")
             
             if taskweaver_session:
-                # 获取工作空间路径
-                if hasattr(taskweaver_session, 'execution_cwd'):
-                    workspace_path = taskweaver_session.execution_cwd
+                # 获取工作空间路径（实例属性，不走类型缓存）
+                workspace_path = getattr(taskweaver_session, 'execution_cwd', None)
+                if workspace_path:
                     session_data["workspace_path"] = workspace_path
                 
                 # 停止TaskWeaver会话
+                session_caps = _caps(taskweaver_session)
                 try:
-                    if hasattr(taskweaver_session, 'stop'):
+                    if 'stop' in session_caps:
                         taskweaver_session.stop()
-                    elif hasattr(taskweaver_session, 'close'):
+                    elif 'close' in session_caps:
                         taskweaver_session.close()
                     
                     # 清理会话内部状态
-                    if hasattr(taskweaver_session, 'clear'):
+                    if 'clear' in session_caps:
                         taskweaver_session.clear()
                         
                 except Exception as session_cleanup_error:
@@ -380,16 +641,17 @@ class SessionManager:
             
             # 清理TaskWeaver应用实例
             if taskweaver_app:
+                app_caps = _caps(taskweaver_app)
                 try:
-                    if hasattr(taskweaver_app, 'cleanup'):
+                    if 'cleanup' in app_caps:
                         taskweaver_app.cleanup()
-                    elif hasattr(taskweaver_app, 'close'):
+                    elif 'close' in app_caps:
                         taskweaver_app.close()
-                    elif hasattr(taskweaver_app, 'shutdown'):
+                    elif 'shutdown' in app_caps:
                         taskweaver_app.shutdown()
                         
                     # 清理应用缓存
-                    if hasattr(taskweaver_app, 'clear_cache'):
+                    if 'clear_cache' in app_caps:
                         taskweaver_app.clear_cache()
                         
                 except Exception as app_cleanup_error:
@@ -401,10 +663,6 @@ class SessionManager:
             session_data["memory_usage"] = 0
             session_data["resource_count"] = 0
             
-            # 强制垃圾回收
-            del taskweaver_session, taskweaver_app
-            gc.collect()
-            
             logger.info("TaskWeaver会话和应用已彻底清理")
         except Exception as e:
             logger.error(f"清理TaskWeaver会话失败: {e}")
@@ -413,10 +671,10 @@ class SessionManager:
         """删除整个工作空间目录（含安全路径检查）"""
         try:
             if workspace_path and os.path.exists(workspace_path):
-                # 修正安全路径检查 - 使用正确的基础路径
-                safe_base = os.path.abspath(self.get_workspace_base_dir())
+                # 安全路径检查 - 必须位于工作空间根目录之内
+                safe_base = self._get_safe_base()
                 abs_path = os.path.abspath(workspace_path)
-                if not abs_path.startswith(safe_base):
+                if os.path.commonpath([abs_path, safe_base]) != safe_base:
                     logger.warning(f"拒绝删除非工作空间路径: {workspace_path}")
                     return
 
@@ -426,144 +684,172 @@ class SessionManager:
                     for path in glob.glob(workspace_path):
                         if os.path.exists(path):
                             shutil.rmtree(path)
-                            logger.info(f"已删除工作空间目录: {path}")
+                            logger.info("已删除工作空间目录: %s", path)
                 else:
                     shutil.rmtree(abs_path)
-                    logger.info(f"已删除工作空间目录: {abs_path}")
+                    logger.info("已删除工作空间目录: %s", abs_path)
             else:
-                logger.debug(f"工作空间目录不存在或路径无效: {workspace_path}")
+                logger.debug("工作空间目录不存在或路径无效: %s", workspace_path)
         except Exception as e:
             logger.error(f"清理工作空间失败 {workspace_path}: {e}")
     
+    def _get_safe_base(self) -> str:
+        """获取规范化后的工作空间根目录（结果缓存）"""
+        if self._safe_base is None:
+            self._safe_base = os.path.normpath(os.path.abspath(self.get_workspace_base_dir()))
+        return self._safe_base
+
     def get_workspace_base_dir(self) -> str:
         """获取工作空间基础目录"""
         from config import get_config
         config = get_config()
         return os.path.join(config.taskweaver_project_path, "workspace", "sessions")
 
+    def _detach_session(self, session_id: str) -> Optional[Dict]:
+        """从所有索引中移除会话记录并返回其数据（调用方需持有写锁）"""
+        session_data = self.sessions.pop(session_id, None)
+        if session_data is None:
+            return None
+        self._unindex_session(session_id, session_data)
+        return session_data
+
+    def _unindex_session(self, session_id: str, session_data: Dict) -> None:
+        """从心跳、会话ID、IP 等辅助索引中移除已弹出的会话（调用方需持有写锁）"""
+        self._heartbeats.pop(session_id, None)
+        self.conversation_ids.pop(session_id, None)
+        if session_data.get("status") == "active":
+            self._active_count -= 1
+        client_ip = session_data.get("client_ip")
+        if client_ip:
+            session_ids = self._ip_index.get(client_ip)
+            if session_ids is not None:
+                session_ids.discard(session_id)
+                if not session_ids:
+                    del self._ip_index[client_ip]
+
     def delete_session(self, session_id: str, chat_service=None) -> bool:
         """删除指定的会话（增强清理）"""
-        with self._lock:
-            if session_id not in self.sessions:
-                logger.warning(f"Session {session_id} not found for deletion")
-                return False
-    
-            try:
-                session_data = self.sessions[session_id]
-                
-                # 先取消活跃任务（如果提供了chat_service）
-                if chat_service:
-                    try:
-                        import asyncio
-                        loop = asyncio.get_event_loop()
-                        if loop.is_running():
-                            asyncio.create_task(chat_service.cancel_task(session_id))
-                        else:
-                            asyncio.run(chat_service.cancel_task(session_id))
-                    except Exception as cancel_error:
-                        logger.error(f"取消会话任务失败: {cancel_error}")
-                
-                # 清理TaskWeaver会话
-                self._cleanup_taskweaver_session(session_data)
-                
-                # 清理工作空间
-                workspace_path = session_data.get("workspace_path")
-                if workspace_path:
-                    self._cleanup_workspace(workspace_path)
-                
-                # 删除会话记录
-                del self.sessions[session_id]
-                if session_id in self.conversation_ids:
-                    del self.conversation_ids[session_id]
+        with self._lock.write_lock():
+            # 先移除会话记录（单次查找）
+            session_data = self._detach_session(session_id)
+        if session_data is None:
+            logger.warning(f"Session {session_id} not found for deletion")
+            return False
 
-                logger.info(f"Deleted session: {session_id}")
-                return True
-                
-            except Exception as e:
-                logger.error(f"Failed to delete session {session_id}: {e}")
-                return False
+        # 会话已从索引中摘除，以下资源清理不再持有锁
+        try:
+            # 先取消活跃任务（如果提供了chat_service）
+            if chat_service:
+                try:
+                    import asyncio
+                    loop = asyncio.get_event_loop()
+                    if loop.is_running():
+                        asyncio.create_task(chat_service.cancel_task(session_id))
+                    else:
+                        asyncio.run(chat_service.cancel_task(session_id))
+                except Exception as cancel_error:
+                    logger.error(f"取消会话任务失败: {cancel_error}")
+            
+            self._destroy_session(session_data)
+
+            logger.info("Deleted session: %s", session_id)
+            return True
+            
+        except Exception as e:
+            logger.error(f"Failed to delete session {session_id}: {e}")
+            return False
 
     def list_sessions(self) -> List[str]:
-        with self._lock:
+        with self._lock.read_lock():
             return list(self.sessions.keys())
 
     def clear_all_sessions(self) -> None:
-        with self._lock:
-            session_ids = list(self.sessions.keys())
-            for session_id in session_ids:
-                self.delete_session(session_id)
-            
-            logger.info(f"清理了 {len(session_ids)} 个会话")
+        # 一次性取出并清空所有会话索引，资源释放在锁外进行
+        with self._lock.write_lock():
+            victims = list(self.sessions.values())
+            self.sessions.clear()
+            self._pending_touches.clear()
+            self._heartbeats.clear()
+            self.conversation_ids.clear()
+            self._ip_index.clear()
+            self._active_count = 0
+
+        if victims:
+            with ThreadPoolExecutor(max_workers=min(8, len(victims))) as executor:
+                list(executor.map(self._destroy_session, victims))
+
+        logger.info("清理了 %s 个会话", len(victims))
+
+    def _destroy_detached(self, victims: List[tuple]) -> None:
+        """依次释放已摘除会话的资源（调用方不应持有锁）"""
+        for session_id, session_data in victims:
+            self._destroy_session(session_data)
+            logger.info("Deleted session: %s", session_id)
+
+    def _destroy_session(self, session_data: Dict) -> None:
+        """释放已从索引中移除的会话的 TaskWeaver 资源和工作空间"""
+        self._cleanup_taskweaver_session(session_data)
+        workspace_path = session_data.get("workspace_path")
+        if workspace_path:
+            self._cleanup_workspace(workspace_path)
 
     def get_conversation_id(self, session_id: str) -> str:
-        with self._lock:
+        with self._lock.read_lock():
             return self.conversation_ids.get(session_id, "")
 
-    def cleanup_inactive_sessions(self, timeout_minutes: int = 30) -> int:
-        activity_cutoff = datetime.now() - timedelta(minutes=timeout_minutes)
-        heartbeat_cutoff = datetime.now() - timedelta(minutes=2)
+    def cleanup_inactive_sessions(self, timeout_minutes: int = 30, now: Optional[float] = None) -> int:
+        # 只读取一次时钟，两个截止时间都基于同一个 now（epoch 秒）计算
+        if now is None:
+            now = time.time()
+        activity_cutoff = now - timeout_minutes * 60
+        heartbeat_cutoff = now - 120
         inactive_sessions = []
 
-        with self._lock:
-            for sid, data in list(self.sessions.items()):
-                last_activity = data.get("last_activity")
-                last_heartbeat = data.get("last_heartbeat")
-
-                # 检查活动时间
-                is_inactive = False
-                if isinstance(last_activity, str):
-                    try:
-                        last_activity = datetime.fromisoformat(last_activity)
-                    except ValueError:
-                        last_activity = None
-                
-                if last_activity and last_activity < activity_cutoff:
-                    is_inactive = True
-
-                # 检查心跳时间
-                is_heartbeat_lost = False
-                if not is_inactive:
-                    if isinstance(last_heartbeat, str):
-                        try:
-                            last_heartbeat = datetime.fromisoformat(last_heartbeat)
-                        except ValueError:
-                            last_heartbeat = None
-                    
-                    if last_heartbeat and last_heartbeat < heartbeat_cutoff:
-                        is_heartbeat_lost = True
-
-                if is_inactive or is_heartbeat_lost:
-                    logger.info(
-                        f"将清理会话 {sid}: "
-                        f"inactive={is_inactive}, heartbeat_lost={is_heartbeat_lost}"
-                    )
+        with self._lock.write_lock():
+            self._apply_pending_touches()
+            # sessions 按最后活动时间排序（最老的在前），遇到未超时的会话即可停止
+            for sid, data in self.sessions.items():
+                if data["last_activity"] >= activity_cutoff:
+                    break
+                logger.info("将清理会话 %s: inactive=True, heartbeat_lost=False", sid)
+                inactive_sessions.append(sid)
+
+            # 心跳同样按时间排序，只需检查队首的过期部分
+            expired = set(inactive_sessions)
+            for sid, last_heartbeat in self._heartbeats.items():
+                if last_heartbeat >= heartbeat_cutoff:
+                    break
+                if sid not in expired:
+                    logger.info("将清理会话 %s: inactive=False, heartbeat_lost=True", sid)
                     inactive_sessions.append(sid)
 
-            for session_id in inactive_sessions:
-                self.delete_session(session_id)
+            victims = [(sid, self._detach_session(sid)) for sid in inactive_sessions]
+
+        self._destroy_detached(victims)
 
         cleaned_count = len(inactive_sessions)
         self._stats["total_cleaned"] += cleaned_count
-        logger.info(f"清理了 {cleaned_count} 个非活跃会话")
+        logger.info("清理了 %s 个非活跃会话", cleaned_count)
         return cleaned_count
 
     def get_session_message_history(self, session_id: str) -> List[Dict]:
-        with self._lock:
+        with self._lock.read_lock():
             session_data = self.sessions.get(session_id)
             if session_data:
-                return session_data.get("messages", [])
+                return list(session_data["messages"])
             return []
 
     def get_session_stats(self) -> Dict:
-        with self._lock:
+        with self._lock.read_lock():
             total_sessions = len(self.sessions)
-            active_sessions = sum(1 for s in self.sessions.values() if s.get("status") == "active")
+            active_sessions = self._active_count
             memory_info = self._memory_monitor.get_memory_usage()
             
             return {
                 "total_sessions": total_sessions,
                 "active_sessions": active_sessions,
                 "cleanup_interval_minutes": self.cleanup_interval_minutes,
+                "current_cleanup_interval_seconds": self._current_interval,
                 "max_sessions": self.max_sessions,
                 "memory_usage": memory_info,
                 "cleanup_stats": self._stats
@@ -581,7 +867,7 @@ class SessionManager:
             import gc
             collected = gc.collect()
             
-            after_memory = self._memory_monitor.get_memory_usage()
+            after_memory = self._memory_monitor.get_memory_usage(force_refresh=True)
             
             return {
                 "before_memory": before_memory,
@@ -597,12 +883,13 @@ class SessionManager:
         """关闭SessionManager并清理所有资源"""
         logger.info("开始关闭SessionManager...")
         
-        # 取消定时器
-        if self._cleanup_timer:
-            self._cleanup_timer.cancel()
-            self._cleanup_timer = None
+        # 停止后台清理线程
+        self._stop_evt.set()
+        if self._worker and self._worker.is_alive():
+            self._worker.join(timeout=5)
+        self._worker = None
         
-        # 清理所有会话
+        # 清理所有会话（各会话的资源释放在线程池中并行执行）
         self.clear_all_sessions()
         
         # 强制垃圾回收
@@ -618,10 +905,8 @@ class SessionManager:
         """
         if not client_ip:
             return []
-        with self._lock:
-            result = []
-            for sid, data in self.sessions.items():
-                if data.get("client_ip") == client_ip:
-                    if (not only_active) or (data.get("status") == "active"):
-                        result.append(sid)
-            return result
\ No newline at end of file
+        with self._lock.read_lock():
+            session_ids = self._ip_index.get(client_ip, ())
+            if not only_active:
+                return list(session_ids)
+            return [sid for sid in session_ids if self.sessions[sid].get("status") == "active"]
\ No newline at end of file
@@ -1,12 +1,21 @@
-from typing import Any, Generator, List, Optional
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Any, Generator, List, Optional
 from injector import inject
 import json
-import requests
 import logging
 import time
-from requests.exceptions import RequestException, Timeout, ConnectionError
+import weakref
+
+if TYPE_CHECKING:
+    import requests
+
+try:
+    import orjson
+except ImportError:  # orjson 为可选依赖，缺失时回退到标准库 json
+    orjson = None
 
-from taskweaver.llm.util import ChatMessageType, format_chat_message
+from taskweaver.llm.util import ChatMessageType, format_chat_message, loads_json
 from .base import CompletionService, EmbeddingService, LLMServiceConfig
 
 DEFAULT_STOP_TOKEN: List[str] = ["</s>"]
@@ -14,6 +23,31 @@ DEFAULT_STOP_TOKEN: List[str] = ["</s>"]
 logger = logging.getLogger(__name__)
 
 
+_retryable_errors: Optional[tuple] = None
+
+
+def _get_retryable_errors() -> tuple:
+    """Resolve the retryable requests exception types on first use and cache them"""
+    global _retryable_errors
+    if _retryable_errors is None:
+        from requests.exceptions import ConnectionError, HTTPError, Timeout
+
+        _retryable_errors = (Timeout, ConnectionError, HTTPError)
+    return _retryable_errors
+
+
+def _close_session(session: requests.Session) -> None:
+    """Close the pooled session when its owning service is collected"""
+    session.close()
+
+
+def _dumps(data: dict) -> bytes:
+    """Serialize request payload to UTF-8 JSON bytes"""
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, ensure_ascii=False).encode("utf-8")
+
+
 class LingyunServiceConfig(LLMServiceConfig):
     """Configuration class for Lingyun service"""
     
@@ -64,8 +98,16 @@ class LingyunServiceConfig(LLMServiceConfig):
         self.top_p = self._get_float("top_p", 0.8)
         self.temperature = self._get_float("temperature", 0.7)
         
+        # 随请求发送的最大历史消息条数，0 表示不限制
+        self.max_history_messages = self._get_int("max_history_messages", 0)
+        
+        # 服务端支持只返回增量内容（bean.delta）时开启，可省去对累计回答的切片
+        self.delta_mode = self._get_bool("delta_mode", False)
+        
         # Request timeout configuration
         self.request_timeout = self._get_int("request_timeout", 120)
+        # 建立连接的超时单独配置，目标不可达时尽快失败，不必等满整个读取超时
+        self.connect_timeout = self._get_int("connect_timeout", 10)
         
         # Retry configuration
         self.max_retries = self._get_int("max_retries", 3)
@@ -95,23 +137,43 @@ class LingyunService(CompletionService, EmbeddingService):
     @inject
     def __init__(self, config: LingyunServiceConfig):
         self.config = config
-        self._session = None
+        self._session = self._create_session()
+        # 使用 weakref.finalize 代替 __del__，回调不持有 self，不会阻碍循环引用的回收
+        self._finalizer = weakref.finalize(self, _close_session, self._session)
+        # 每次请求都相同的固定字段，调用时浅拷贝后再补充动态字段
+        self._payload_template = {
+            "type": config.model,
+            "frontendId": config.frontend_id,
+            "phone": config.phone,  # 新增必需参数 - 固定值
+            "systemId": config.system_id,  # 新增必需参数 - 固定值
+        }
+
+    def _create_session(self) -> requests.Session:
+        """Create a pooled requests session with default headers set once"""
+        # requests 仅在实际使用凌云服务时才导入，避免拖慢 taskweaver.llm 的导入
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        session = requests.Session()
+        # 复用连接池，避免并发调用时频繁重新建立 TCP 连接
+        adapter = HTTPAdapter(pool_connections=16, pool_maxsize=64)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        # Set default headers
+        session.headers.update({
+            "Content-Type": "application/json",
+            "User-Agent": "TaskWeaver-Lingyun-Client/1.0"
+        })
+        if self.config.api_key:
+            # 修正认证头字段名为官方文档要求的 LLM-Authorization
+            session.headers.update({
+                "LLM-Authorization": self.config.api_key
+            })
+        return session
 
     @property
     def session(self) -> requests.Session:
-        """Lazy initialization of requests session"""
-        if self._session is None:
-            self._session = requests.Session()
-            # Set default headers
-            self._session.headers.update({
-                "Content-Type": "application/json",
-                "User-Agent": "TaskWeaver-Lingyun-Client/1.0"
-            })
-            if self.config.api_key:
-                # 修正认证头字段名为官方文档要求的 LLM-Authorization
-                self._session.headers.update({
-                    "LLM-Authorization": self.config.api_key
-                })
+        """Shared requests session"""
         return self._session
 
     def _should_retry(self, exception: Exception, attempt: int) -> bool:
@@ -119,11 +181,12 @@ class LingyunService(CompletionService, EmbeddingService):
         if attempt >= self.config.max_retries:
             return False
             
-        if isinstance(exception, Timeout) and self.config.retry_on_timeout:
+        timeout_error, connection_error, http_error = _get_retryable_errors()
+        if isinstance(exception, timeout_error) and self.config.retry_on_timeout:
             return True
-        elif isinstance(exception, ConnectionError) and self.config.retry_on_connection_error:
+        elif isinstance(exception, connection_error) and self.config.retry_on_connection_error:
             return True
-        elif isinstance(exception, requests.HTTPError):
+        elif isinstance(exception, http_error):
             # Retry on server errors (5xx) if configured
             if self.config.retry_on_server_error and hasattr(exception, 'response'):
                 return exception.response.status_code >= 500
@@ -136,7 +199,11 @@ class LingyunService(CompletionService, EmbeddingService):
 
     def _make_request_with_retry(self, data: dict, stream: bool = True) -> requests.Response:
         """Make HTTP request with retry mechanism"""
+        retryable_errors = _get_retryable_errors()
+        timeout_error, connection_error, http_error = retryable_errors
         last_exception = None
+        # 只序列化一次，重试时复用同一请求体
+        body = _dumps(data)
         
         for attempt in range(self.config.max_retries + 1):
             try:
@@ -144,14 +211,14 @@ class LingyunService(CompletionService, EmbeddingService):
                 
                 response = self.session.post(
                     self.config.api_base,
-                    json=data,
-                    timeout=self.config.request_timeout,
+                    data=body,
+                    timeout=(self.config.connect_timeout, self.config.request_timeout),
                     stream=stream
                 )
                 response.raise_for_status()
                 return response
                 
-            except (Timeout, ConnectionError, requests.HTTPError) as e:
+            except retryable_errors as e:
                 last_exception = e
                 
                 if self._should_retry(e, attempt):
@@ -171,13 +238,13 @@ class LingyunService(CompletionService, EmbeddingService):
                 break
         
         # If we get here, all retries failed or we hit a non-retryable error
-        if isinstance(last_exception, Timeout):
+        if isinstance(last_exception, timeout_error):
             logger.error(f"Request timeout after {self.config.max_retries + 1} attempts")
             raise Exception(f"Lingyun API request timeout after {self.config.max_retries + 1} attempts")
-        elif isinstance(last_exception, ConnectionError):
+        elif isinstance(last_exception, connection_error):
             logger.error(f"Connection error after {self.config.max_retries + 1} attempts: {last_exception}")
             raise Exception(f"Failed to connect to Lingyun API after {self.config.max_retries + 1} attempts: {last_exception}")
-        elif isinstance(last_exception, requests.HTTPError):
+        elif isinstance(last_exception, http_error):
             logger.error(f"HTTP error after {self.config.max_retries + 1} attempts: {last_exception}")
             raise Exception(f"Lingyun API HTTP error after {self.config.max_retries + 1} attempts: {last_exception}")
         else:
@@ -203,6 +270,8 @@ class LingyunService(CompletionService, EmbeddingService):
         # Check for JSON format requirements
         response_format = kwargs.get('response_format')
         json_schema = kwargs.get('json_schema')
+        # 调用方可传入预先序列化好的 schema 字符串，schema 不变时省去每次请求的 json.dumps
+        json_schema_str = kwargs.get('json_schema_str')
         
         # Prepare parameters
         temperature = temperature if temperature is not None else self.config.temperature
@@ -210,33 +279,34 @@ class LingyunService(CompletionService, EmbeddingService):
         stop = stop if stop is not None else self.config.stop_token
 
         # Prepare request data
-        history = messages[:-1] if len(messages) > 1 else []
         prompt = messages[-1]['content']
+        # 历史消息直接切片写入请求体，配置了上限时只保留最近的若干条
+        history_start = 0
+        if self.config.max_history_messages > 0:
+            history_start = max(0, len(messages) - 1 - self.config.max_history_messages)
         
         # Add JSON format instruction if required
         if response_format and response_format.get('type') == 'json_object':
-            if json_schema:
+            if json_schema_str or json_schema:
                 # Add schema instruction to prompt
-                schema_instruction = f"\n\nPlease respond with a valid JSON object that follows this schema: {json.dumps(json_schema)}"
-                prompt += schema_instruction
+                if json_schema_str is None:
+                    json_schema_str = json.dumps(json_schema)
+                prompt += f"\n\nPlease respond with a valid JSON object that follows this schema: {json_schema_str}"
             else:
                 # Add general JSON instruction
                 prompt += "\n\nPlease respond with a valid JSON object."
         
         # 按照官方文档要求构建请求数据，添加必需的phone和systemId参数
-        data = {
+        data = self._payload_template.copy()
+        data.update({
             "queryText": str(prompt),
             "msgId": kwargs.get("msg_id", ""),
             "sessionId": kwargs.get("session_id", "default_session"),
             "templateId": kwargs.get("template_id", ""),
-            "type": self.config.model,
-            "history": history,
+            "history": messages[history_start:-1],
             "temperature": str(temperature),  # 确保为字符串类型
-            "frontendId": self.config.frontend_id,
             "ext": kwargs.get("ext", {}),
-            "phone": self.config.phone,  # 新增必需参数 - 固定值
-            "systemId": self.config.system_id  # 新增必需参数 - 固定值
-        }
+        })
         
         # 只在非流式请求时添加max_tokens和top_p
         if not stream:
@@ -247,46 +317,63 @@ class LingyunService(CompletionService, EmbeddingService):
 
         logger.debug(f"Sending request to Lingyun API: {self.config.api_base}")
         
-        try:
-            # Use the new retry mechanism
-            response = self._make_request_with_retry(data, stream)
-            
-            if stream:
-                yield from self._handle_streaming_response(response, response_format)
-            else:
-                yield from self._handle_non_streaming_response(response, response_format)
-                
-        except Exception as e:
-            # Re-raise the exception with context
-            raise e
+        # Use the new retry mechanism
+        response = self._make_request_with_retry(data, stream)
+        
+        if stream:
+            yield from self._handle_streaming_response(response, response_format)
+        else:
+            yield from self._handle_non_streaming_response(response, response_format)
+
+    @staticmethod
+    def _iter_response_lines(response: requests.Response) -> Generator[bytes, None, None]:
+        """Split a streamed response body into non-empty byte lines as data arrives"""
+        # 不按固定块大小读取，收到多少处理多少；在同一个 bytearray 中查找换行，只切出完整的行
+        buf = bytearray()
+        for chunk in response.iter_content(chunk_size=None):
+            buf += chunk
+            start = 0
+            while True:
+                end = buf.find(b"\n", start)
+                if end < 0:
+                    break
+                line = bytes(buf[start:end]).rstrip(b"\r")
+                start = end + 1
+                if line:
+                    yield line
+            if start:
+                del buf[:start]
+        line = bytes(buf).strip()
+        if line:
+            yield line
 
     def _handle_streaming_response(self, response: requests.Response, response_format=None) -> Generator[ChatMessageType, None, None]:
         """Handle streaming response from Lingyun API"""
-        prev_answer = ""
+        # 服务端每次返回的是累计的完整回答，只记录已输出的长度，按偏移切出新增部分
+        prev_len = 0
+        current_answer = ""
+        # 提前计算是否为 JSON 模式，避免在逐行循环中重复判断
+        json_mode = bool(response_format) and response_format.get('type') == 'json_object'
+        delta_mode = self.config.delta_mode
+        # 增量模式下仅在需要做 JSON 校验时才收集各段内容
+        delta_parts: List[str] = []
         
         try:
-            for line in response.iter_lines(decode_unicode=True):
-                if not line:
-                    continue
-                    
+            # 以字节模式读取，直接解析 UTF-8 字节，省去逐行解码
+            for line in self._iter_response_lines(response):
                 try:
-                    response_json = json.loads(line)
-                    if "bean" in response_json and "answer" in response_json["bean"]:
+                    response_json = loads_json(line)
+                    if delta_mode:
+                        delta = response_json["bean"].get("delta") if "bean" in response_json else None
+                        if delta:
+                            if json_mode:
+                                delta_parts.append(delta)
+                            yield format_chat_message("assistant", delta)
+                    elif "bean" in response_json and "answer" in response_json["bean"]:
                         current_answer = response_json["bean"]["answer"]
-                        new_content = current_answer[len(prev_answer):]
-                        
-                        if new_content:
-                            prev_answer = current_answer
-                            
-                            # Validate JSON format if required
-                            if response_format and response_format.get('type') == 'json_object':
-                                try:
-                                    # Try to parse the complete answer as JSON
-                                    json.loads(current_answer)
-                                except json.JSONDecodeError:
-                                    # If not valid JSON yet, continue accumulating
-                                    pass
-                            
+                        if len(current_answer) > prev_len:
+                            new_content = current_answer[prev_len:]
+                            prev_len = len(current_answer)
                             yield format_chat_message("assistant", new_content)
                             
                 except json.JSONDecodeError as e:
@@ -295,6 +382,15 @@ class LingyunService(CompletionService, EmbeddingService):
                 except KeyError as e:
                     logger.warning(f"Unexpected response format: {line}, missing key: {e}")
                     continue
+
+            # JSON 模式下只在流结束时校验一次完整回答，避免对不断增长的字符串反复解析
+            if delta_mode:
+                current_answer = "".join(delta_parts)
+            if json_mode and current_answer:
+                try:
+                    loads_json(current_answer)
+                except json.JSONDecodeError:
+                    logger.warning("Lingyun streaming response is not valid JSON")
                     
         except Exception as e:
             logger.error(f"Error processing streaming response: {e}")
@@ -303,14 +399,14 @@ class LingyunService(CompletionService, EmbeddingService):
     def _handle_non_streaming_response(self, response: requests.Response, response_format=None) -> Generator[ChatMessageType, None, None]:
         """Handle non-streaming response from Lingyun API"""
         try:
-            response_json = response.json()
+            response_json = loads_json(response.content)
             if "bean" in response_json and "answer" in response_json["bean"]:
                 generation = response_json["bean"]["answer"]
                 
                 # Validate JSON format if required
                 if response_format and response_format.get('type') == 'json_object':
                     try:
-                        json.loads(generation)
+                        loads_json(generation)
                     except json.JSONDecodeError as e:
                         logger.error(f"Response is not valid JSON: {generation}")
                         raise Exception(f"Invalid JSON response from Lingyun API: {e}")
@@ -334,7 +430,12 @@ class LingyunService(CompletionService, EmbeddingService):
         logger.warning("Embeddings not implemented for Lingyun service")
         raise NotImplementedError("Embeddings are not yet implemented for Lingyun service")
 
-    def __del__(self):
-        """Cleanup resources"""
-        if self._session:
-            self._session.close()
\ No newline at end of file
+    def close(self) -> None:
+        """Release the pooled HTTP connections"""
+        self._finalizer()
+
+    def __enter__(self) -> "LingyunService":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
@@ -4,15 +4,30 @@ from typing import TYPE_CHECKING, Any, Generator, List, Optional
 
 from injector import inject
 
-from taskweaver.llm.util import ChatMessageType, format_chat_message
+from taskweaver.llm.util import ChatMessageType, format_chat_message, loads_json
 
 from .base import CompletionService, EmbeddingService, LLMServiceConfig
 
 DEFAULT_STOP_TOKEN: List[str] = ["<|endoftext|>", "</s>"]
 
+# 单次嵌入请求的最大文本条数，避免超长输入造成单个请求过大
+EMBEDDING_BATCH_SIZE = 128
+
 if TYPE_CHECKING:
     from openai import OpenAI
 
+_openai: Any = None
+
+
+def _get_openai() -> Any:
+    """首次使用时导入 openai 模块并缓存，避免每次调用重复执行导入语句"""
+    global _openai
+    if _openai is None:
+        import openai
+
+        _openai = openai
+    return _openai
+
 
 class LocalServiceConfig(LLMServiceConfig):
     def _configure(self) -> None:
@@ -75,16 +90,16 @@ class LocalService(CompletionService, EmbeddingService):
     def __init__(self, config: LocalServiceConfig):
         self.config = config
         self._client: Optional[OpenAI] = None
+        # 仅当模型不支持system角色或要求角色交替时才需要预处理消息
+        self._needs_preproc = (not config.support_system_role) or config.require_alternative_roles
     
     @property
     def client(self):
-        from openai import OpenAI
-        
         if self._client is not None:
             return self._client
         
         # 创建OpenAI客户端连接到本地vLLM服务
-        client = OpenAI(
+        client = _get_openai().OpenAI(
             base_url=self.config.api_base,
             api_key=self.config.api_key,
             timeout=self.config.timeout,
@@ -104,7 +119,7 @@ class LocalService(CompletionService, EmbeddingService):
         stop: Optional[List[str]] = None,
         **kwargs: Any,
     ) -> Generator[ChatMessageType, None, None]:
-        import openai
+        openai = _get_openai()
         
         engine = self.config.model
         
@@ -129,23 +144,27 @@ class LocalService(CompletionService, EmbeddingService):
             if self.config.support_constrained_generation and "json_schema" in kwargs:
                 extra_body["guided_json"] = kwargs["json_schema"]
                         
-            # 消息预处理
-            processed_messages = messages.copy()
-            for i, message in enumerate(processed_messages):
-                # 如果不支持system角色，转换为user
-                if (not self.config.support_system_role) and message["role"] == "system":
-                    message["role"] = "user"
-                
-                # 如果需要交替角色，添加虚拟assistant消息
-                if self.config.require_alternative_roles:
-                    if i > 0 and message["role"] == "user" and processed_messages[i - 1]["role"] == "user":
-                        processed_messages.insert(
-                            i,
-                            {"role": "assistant", "content": "我明白了。"},
-                        )
+            # 消息预处理（常见配置下无需处理，直接使用原始消息）
+            processed_messages = messages
+            if self._needs_preproc:
+                # 单次线性遍历重建消息列表，不修改调用方传入的消息对象
+                processed_messages = []
+                prev_role = None
+                for message in messages:
+                    role = message["role"]
+                    # 如果不支持system角色，转换为user
+                    if (not self.config.support_system_role) and role == "system":
+                        role = "user"
+                    
+                    # 如果需要交替角色，添加虚拟assistant消息
+                    if self.config.require_alternative_roles and prev_role == "user" and role == "user":
+                        processed_messages.append({"role": "assistant", "content": "我明白了。"})
+                    
+                    processed_messages.append(message if role == message["role"] else {**message, "role": role})
+                    prev_role = role
             
             # 调用本地vLLM服务
-            res: Any = self.client.chat.completions.create(
+            request_kwargs = dict(
                 model=engine,
                 messages=processed_messages,  # type: ignore
                 temperature=temperature,
@@ -162,20 +181,11 @@ class LocalService(CompletionService, EmbeddingService):
             )
             
             if stream:
-                role: Any = None
-                for stream_res in res:
-                    if not stream_res.choices:
-                        continue
-                    delta = stream_res.choices[0].delta
-                    if delta is None:
-                        continue
-                    
-                    role = delta.role if delta.role is not None else role
-                    content = delta.content if delta.content is not None else ""
-                    if content is None:
-                        continue
-                    yield format_chat_message(role, content)
+                # 直接解析原始 SSE 行，只读取 role/content，避免为每个 token 构造 ChatCompletionChunk 模型
+                with self.client.chat.completions.with_streaming_response.create(**request_kwargs) as raw:
+                    yield from self._iter_sse_messages(raw.iter_lines())
             else:
+                res: Any = self.client.chat.completions.create(**request_kwargs)
                 oai_response = res.choices[0].message
                 if oai_response is None:
                     raise Exception("本地模型API返回了空响应")
@@ -216,14 +226,55 @@ class LocalService(CompletionService, EmbeddingService):
         except Exception as e:
             raise Exception(f"连接本地模型时发生未知错误: {e}")
     
+    @staticmethod
+    def _iter_sse_messages(lines: Any) -> Generator[ChatMessageType, None, None]:
+        """解析 chat.completions 流式 SSE 行，逐个产出增量消息"""
+        role: Any = None
+        for line in lines:
+            if not line.startswith("data:"):
+                continue
+            data = line[5:].strip()
+            if data == "[DONE]":
+                break
+            
+            chunk = loads_json(data)
+            if "error" in chunk:
+                raise Exception(f"本地模型API错误: {chunk['error']}")
+            
+            choices = chunk.get("choices")
+            if not choices:
+                continue
+            delta = choices[0].get("delta")
+            if not delta:
+                continue
+            
+            role = delta.get("role") or role
+            content = delta.get("content") or ""
+            yield format_chat_message(role, content)
+    
     def get_embeddings(self, strings: List[str]) -> List[List[float]]:
         """获取文本嵌入向量"""
+        import base64
+
+        import numpy as np
+
         try:
-            embedding_results = self.client.embeddings.create(
-                input=strings,
-                model=self.config.embedding_model,
-            ).data
-            return [r.embedding for r in embedding_results]
+            embeddings: List[List[float]] = []
+            for start in range(0, len(strings), EMBEDDING_BATCH_SIZE):
+                # 以 base64 传输 float32 原始字节，减少传输体积并省去逐个浮点数的 JSON 解析
+                embedding_results = self.client.embeddings.create(
+                    input=strings[start : start + EMBEDDING_BATCH_SIZE],
+                    model=self.config.embedding_model,
+                    encoding_format="base64",
+                ).data
+                for r in embedding_results:
+                    if isinstance(r.embedding, str):
+                        embeddings.append(
+                            np.frombuffer(base64.b64decode(r.embedding), dtype=np.float32).tolist(),
+                        )
+                    else:
+                        embeddings.append(r.embedding)
+            return embeddings
         except Exception as e:
             # 如果本地模型不支持嵌入，可以回退到其他方案
             raise Exception(f"本地模型嵌入服务错误: {e}。请确保模型支持嵌入功能或配置其他嵌入服务。")
\ No newline at end of file
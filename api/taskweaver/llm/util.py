@@ -1,5 +1,11 @@
+import json
 from typing import Any, Dict, List, Literal, Optional, TypedDict, Union
 
+try:
+    import orjson
+except ImportError:  # orjson 为可选依赖，缺失时回退到标准库 json
+    orjson = None
+
 ChatMessageRoleType = Literal["system", "user", "assistant", "function"]
 ChatContentType = Dict[Literal["type", "text", "image_url"], str | Dict[Literal["url"], str]]
 ChatMessageType = Dict[Literal["role", "name", "content"], str | List[ChatContentType]]
@@ -7,6 +13,13 @@ ChatMessageType = Dict[Literal["role", "name", "content"], str | List[ChatConten
 PromptTypeSimple = List[ChatMessageType]
 
 
+def loads_json(data: Any) -> Any:
+    """Parse JSON from str or UTF-8 bytes (orjson.JSONDecodeError subclasses json.JSONDecodeError)"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
 class PromptFunctionType(TypedDict):
     name: str
     description: str
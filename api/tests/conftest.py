@@ -0,0 +1,50 @@
+import os
+import sys
+import types
+
+import pytest
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if API_DIR not in sys.path:
+    sys.path.insert(0, API_DIR)
+
+
+def _install_placeholder(name: str, **attrs) -> None:
+    """依赖未安装时放入仅供 import 使用的占位模块（测试不会调用其中的功能）"""
+    module = types.ModuleType(name)
+    module.__dict__.update(attrs)
+    sys.modules[name] = module
+
+
+try:
+    import psutil  # noqa: F401
+except ImportError:
+    _install_placeholder("psutil")
+
+try:
+    import fastapi  # noqa: F401
+except ImportError:
+    class HTTPException(Exception):
+        def __init__(self, status_code: int, detail=None):
+            super().__init__(status_code, detail)
+            self.status_code = status_code
+            self.detail = detail
+
+    _install_placeholder("fastapi", HTTPException=HTTPException, Request=type("Request", (), {}))
+
+try:
+    from taskweaver.session.session import Session  # noqa: F401
+    from taskweaver.app.app import TaskWeaverApp  # noqa: F401
+except ImportError:
+    _install_placeholder("taskweaver.session.session", Session=type("Session", (), {}))
+    _install_placeholder("taskweaver.app.app", TaskWeaverApp=type("TaskWeaverApp", (), {}))
+
+
+@pytest.fixture
+def session_manager(tmp_path):
+    from session_manager import SessionManager
+
+    manager = SessionManager(cleanup_interval_minutes=60, max_sessions=100)
+    manager._safe_base = str(tmp_path)
+    yield manager
+    manager.shutdown()
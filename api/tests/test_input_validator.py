@@ -0,0 +1,54 @@
+import uuid
+
+import pytest
+from fastapi import HTTPException
+
+from utils import input_validator
+from utils.input_validator import InputValidator
+
+
+def test_validate_session_id_accepts_uuid():
+    session_id = str(uuid.uuid4())
+    assert InputValidator.validate_session_id(session_id) == session_id
+
+
+@pytest.mark.parametrize("value", ["not-a-uuid", str(uuid.uuid4()) + "\n", "a" * 10_000])
+def test_validate_session_id_rejects_invalid(value):
+    with pytest.raises(HTTPException) as exc_info:
+        InputValidator.validate_session_id(value)
+    assert exc_info.value.detail == "无效的会话ID格式"
+
+
+def test_wrong_length_session_ids_are_not_cached():
+    input_validator._match_uuid.cache_clear()
+    for i in range(100):
+        with pytest.raises(HTTPException):
+            InputValidator.validate_session_id("x" * (1000 + i))
+    assert input_validator._match_uuid.cache_info().currsize == 0
+
+
+@pytest.mark.parametrize(
+    "name, detail",
+    [
+        ("1table", "表名格式无效"),
+        ("a" * 65, "表名过长"),
+        ("1" + "a" * 100, "表名格式无效"),
+    ],
+)
+def test_validate_table_name_errors(name, detail):
+    with pytest.raises(HTTPException) as exc_info:
+        InputValidator.validate_table_name(name)
+    assert exc_info.value.detail == detail
+
+
+def test_validate_column_name_accepts_max_length():
+    name = "c" * 64
+    assert InputValidator.validate_column_name(name) == name
+
+
+def test_long_identifiers_are_not_cached():
+    input_validator._check_short_identifier.cache_clear()
+    for i in range(100):
+        with pytest.raises(HTTPException):
+            InputValidator.validate_column_name("c" * (100 + i))
+    assert input_validator._check_short_identifier.cache_info().currsize == 0
@@ -0,0 +1,17 @@
+import json
+
+import pytest
+
+pytest.importorskip("injector")  # taskweaver.llm 包在导入时依赖 injector
+
+from taskweaver.llm.util import loads_json  # noqa: E402
+
+
+@pytest.mark.parametrize("data", ['{"a": [1, "中文"]}', '{"a": [1, "中文"]}'.encode("utf-8")])
+def test_loads_json_accepts_str_and_bytes(data):
+    assert loads_json(data) == {"a": [1, "中文"]}
+
+
+def test_loads_json_raises_stdlib_decode_error():
+    with pytest.raises(json.JSONDecodeError):
+        loads_json("{not json")
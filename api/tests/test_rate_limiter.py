@@ -0,0 +1,121 @@
+import asyncio
+import sys
+import types
+
+import pytest
+
+from utils import rate_limiter as rl
+
+
+class FakeRedisClient:
+    def __init__(self, url, **kwargs):
+        self.url = url
+        self.kwargs = kwargs
+        self.counts = {}
+        self.fail = False
+        self.calls = 0
+
+    def register_script(self, script):
+        # 按 _SCRIPT 的 Lua 逻辑模拟：上一窗口计数按剩余比例折算 + 当前窗口计数
+        async def run(keys, args):
+            self.calls += 1
+            if self.fail:
+                raise TimeoutError("redis timed out")
+            self.keys = keys
+            max_requests, _window_seconds, elapsed_ratio = args
+            curr = self.counts.get(keys[0], 0)
+            prev = self.counts.get(keys[1], 0)
+            if prev * (1 - float(elapsed_ratio)) + curr >= int(max_requests):
+                return 0
+            self.counts[keys[0]] = curr + 1
+            return 1
+
+        return run
+
+
+class Clock:
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture(autouse=True)
+def clock(monkeypatch):
+    # 默认固定在窗口中间，避免测试跨越窗口边界
+    clock = Clock(1_000_000_030.0)
+    monkeypatch.setattr(rl.time, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    clients = []
+
+    def from_url(url, **kwargs):
+        client = FakeRedisClient(url, **kwargs)
+        clients.append(client)
+        return client
+
+    redis_module = types.ModuleType("redis")
+    asyncio_module = types.ModuleType("redis.asyncio")
+    asyncio_module.from_url = from_url
+    redis_module.asyncio = asyncio_module
+    monkeypatch.setitem(sys.modules, "redis", redis_module)
+    monkeypatch.setitem(sys.modules, "redis.asyncio", asyncio_module)
+    return clients
+
+
+def test_redis_client_uses_short_socket_timeouts(fake_redis):
+    rl.RedisRateLimiter("redis://localhost:6379/0")
+
+    kwargs = fake_redis[0].kwargs
+    assert 0 < kwargs["socket_timeout"] <= 0.5
+    assert 0 < kwargs["socket_connect_timeout"] <= 0.5
+
+
+def test_redis_script_counts_per_window(fake_redis):
+    limiter = rl.RedisRateLimiter("redis://localhost:6379/0")
+
+    results = [asyncio.run(limiter.is_allowed("ip:GET:/x", 2, 60)) for _ in range(3)]
+
+    assert results == [True, True, False]
+    assert fake_redis[0].keys == ["rl:ip:GET:/x:16666667", "rl:ip:GET:/x:16666666"]
+
+
+def test_redis_and_in_process_limiters_agree_across_window_boundary(fake_redis, clock):
+    redis_limiter = rl.RedisRateLimiter("redis://localhost:6379/0")
+    local_limiter = rl.RateLimiter()
+    window_start = 1_000_000_020.0  # 60 秒窗口的起点
+
+    # 上一窗口末尾用满配额，新窗口开始后按剩余比例逐步释放
+    for now in [window_start + 50, window_start + 59, window_start + 60, window_start + 75,
+                window_start + 90, window_start + 105, window_start + 119]:
+        clock.now = now
+        for _ in range(3):
+            expected = local_limiter.is_allowed("k", 5, 60)
+            assert asyncio.run(redis_limiter.is_allowed("k", 5, 60)) is expected
+
+
+def test_redis_failure_falls_back_and_backs_off(fake_redis, monkeypatch):
+    limiter = rl.RedisRateLimiter("redis://localhost:6379/0")
+    client = fake_redis[0]
+    client.fail = True
+    monkeypatch.setattr(rl, "_get_redis_rate_limiter", lambda: limiter)
+    monkeypatch.setattr(rl, "rate_limiter", rl.RateLimiter())
+
+    assert asyncio.run(limiter.is_allowed("k", 1, 60)) is None
+    # 退避期内不再访问 Redis，直接使用进程内计数
+    assert asyncio.run(rl._is_allowed("k", 1, 60)) is True
+    assert asyncio.run(rl._is_allowed("k", 1, 60)) is False
+    assert client.calls == 1
+
+
+def test_falls_back_to_in_process_limiter_without_redis(monkeypatch):
+    monkeypatch.setattr(rl, "_get_redis_rate_limiter", lambda: None)
+    monkeypatch.setattr(rl, "rate_limiter", rl.RateLimiter())
+
+    results = [asyncio.run(rl._is_allowed("k", 2, 60)) for _ in range(3)]
+
+    assert results == [True, True, False]
@@ -0,0 +1,141 @@
+import threading
+import time
+
+import pytest
+
+from session_manager import ReadWriteLock
+
+
+def _start(target):
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    return thread
+
+
+def test_readers_share_the_lock():
+    lock = ReadWriteLock()
+    inside = threading.Barrier(2, timeout=2)
+
+    def reader():
+        with lock.read_lock():
+            inside.wait()
+
+    threads = [_start(reader) for _ in range(2)]
+    for thread in threads:
+        thread.join(2)
+        assert not thread.is_alive()
+
+
+def test_queued_writer_blocks_new_readers():
+    lock = ReadWriteLock()
+    order = []
+    first_reader_in = threading.Event()
+    release_first_reader = threading.Event()
+
+    def first_reader():
+        with lock.read_lock():
+            first_reader_in.set()
+            release_first_reader.wait(2)
+            order.append("reader1")
+
+    def writer():
+        with lock.write_lock():
+            order.append("writer")
+
+    def second_reader():
+        with lock.read_lock():
+            order.append("reader2")
+
+    threads = [_start(first_reader)]
+    assert first_reader_in.wait(2)
+    threads.append(_start(writer))
+    while not lock._waiting_writers:
+        time.sleep(0.001)
+    threads.append(_start(second_reader))
+    time.sleep(0.05)
+    assert order == []  # 写者排队期间新读者不能插队
+
+    release_first_reader.set()
+    for thread in threads:
+        thread.join(2)
+        assert not thread.is_alive()
+    assert order == ["reader1", "writer", "reader2"]
+
+
+def test_writer_is_not_starved_by_overlapping_readers():
+    lock = ReadWriteLock()
+    stop = threading.Event()
+    acquired = threading.Event()
+
+    def reader():
+        while not stop.is_set():
+            with lock.read_lock():
+                time.sleep(0.001)
+
+    readers = [_start(reader) for _ in range(4)]
+    time.sleep(0.01)
+
+    def writer():
+        with lock.write_lock():
+            acquired.set()
+
+    _start(writer)
+    try:
+        assert acquired.wait(2)
+    finally:
+        stop.set()
+        for thread in readers:
+            thread.join(2)
+
+
+def test_reentrant_read_does_not_deadlock_with_queued_writer():
+    lock = ReadWriteLock()
+    reader_in = threading.Event()
+    done = threading.Event()
+
+    def reader():
+        with lock.read_lock():
+            reader_in.set()
+            while not lock._waiting_writers:
+                time.sleep(0.001)
+            with lock.read_lock():
+                pass
+        done.set()
+
+    def writer():
+        with lock.write_lock():
+            pass
+
+    _start(reader)
+    assert reader_in.wait(2)
+    writer_thread = _start(writer)
+    assert done.wait(2)
+    writer_thread.join(2)
+    assert not writer_thread.is_alive()
+
+
+def test_write_lock_is_reentrant_and_allows_reads():
+    lock = ReadWriteLock()
+    with lock.write_lock():
+        with lock.write_lock():
+            with lock.read_lock():
+                pass
+    assert lock._writer is None
+    assert not lock._readers
+
+
+def test_upgrading_read_to_write_raises():
+    lock = ReadWriteLock()
+    with lock.read_lock():
+        with pytest.raises(RuntimeError):
+            with lock.write_lock():
+                pass
+    # 升级失败后锁状态保持一致，其他线程仍能获取写锁
+    acquired = threading.Event()
+
+    def writer():
+        with lock.write_lock():
+            acquired.set()
+
+    _start(writer)
+    assert acquired.wait(2)
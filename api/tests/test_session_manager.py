@@ -0,0 +1,146 @@
+import os
+import threading
+
+
+class FakeTaskWeaverSession:
+    def __init__(self, workspace):
+        self.workspace = workspace
+        self.execution_cwd = os.path.join(workspace, "cwd")
+        os.makedirs(self.execution_cwd)
+        self.stopped = False
+
+    def stop(self):
+        self.stopped = True
+
+
+def _attach(manager, session_id, workspace):
+    manager.create_session(session_id)
+    taskweaver_session = FakeTaskWeaverSession(workspace)
+    manager.sessions[session_id]["taskweaver_session"] = taskweaver_session
+    return taskweaver_session
+
+
+def test_delete_session_removes_only_execution_cwd(session_manager, tmp_path):
+    taskweaver_session = _attach(session_manager, "sid", str(tmp_path / "ws"))
+
+    assert session_manager.delete_session("sid")
+
+    assert taskweaver_session.stopped
+    assert not os.path.exists(taskweaver_session.execution_cwd)
+    assert os.path.isdir(taskweaver_session.workspace)
+
+
+def test_fast_path_touches_are_deduplicated(session_manager):
+    session_manager.create_session("a")
+    session_manager.create_session("b")
+
+    for _ in range(1000):
+        session_manager.get_or_create_session("a")
+
+    assert list(session_manager._pending_touches) == ["a"]
+
+
+def test_fast_path_drains_touches_past_limit(session_manager, monkeypatch):
+    monkeypatch.setattr(session_manager, "PENDING_TOUCH_LIMIT", 3)
+    for sid in "abcde":
+        session_manager.create_session(sid)
+
+    for sid in "abcd":
+        session_manager.get_or_create_session(sid)
+
+    assert not session_manager._pending_touches
+    assert list(session_manager.sessions) == ["e", "a", "b", "c", "d"]
+
+
+def test_pending_touches_applied_in_access_order(session_manager):
+    for sid in "abc":
+        session_manager.create_session(sid)
+
+    for sid in ("b", "a", "b"):
+        session_manager.get_or_create_session(sid)
+    with session_manager._lock.write_lock():
+        session_manager._apply_pending_touches()
+
+    assert list(session_manager.sessions) == ["c", "a", "b"]
+
+
+def test_fast_path_waits_for_writer(session_manager):
+    session_manager.create_session("sid")
+    session_manager.sessions["sid"]["last_activity"] = 0.0
+    writer_in = threading.Event()
+    release_writer = threading.Event()
+    result = []
+
+    def writer():
+        with session_manager._lock.write_lock():
+            writer_in.set()
+            release_writer.wait(2)
+            # 写锁期间会话已被清理摘除
+            session_manager._detach_session("sid")
+
+    def reader():
+        result.append(session_manager.get_or_create_session("sid"))
+
+    writer_thread = threading.Thread(target=writer)
+    writer_thread.start()
+    assert writer_in.wait(2)
+    reader_thread = threading.Thread(target=reader)
+    reader_thread.start()
+    reader_thread.join(0.05)
+    assert reader_thread.is_alive()  # 快速路径不能绕过写锁
+
+    release_writer.set()
+    writer_thread.join(2)
+    reader_thread.join(2)
+    # 会话被摘除后走创建路径，返回的是新的会话而不是已清理的旧会话
+    assert result[0] is session_manager.sessions["sid"]
+    assert result[0]["last_activity"] > 0
+
+def test_shrink_message_history_keeps_configured_maxlen(session_manager):
+    session_manager.create_session("sid")
+    messages = session_manager.sessions["sid"]["messages"]
+    messages.extend(range(500))
+
+    session_manager._shrink_message_history()
+
+    assert list(messages) == list(range(250, 500))
+    assert messages.maxlen == session_manager.max_messages_per_session
+    messages.extend(range(500, 1000))
+    assert len(messages) == session_manager.max_messages_per_session
+
+
+def test_shrink_message_history_respects_min_keep(session_manager):
+    session_manager.create_session("sid")
+    messages = session_manager.sessions["sid"]["messages"]
+    messages.extend(range(30))
+
+    session_manager._shrink_message_history(min_keep=50)
+
+    assert len(messages) == 30
+
+
+
+def test_session_configs_do_not_share_list_values(session_manager):
+    session_manager.create_session("a")
+    session_manager.create_session("b", {"llm.model": "other"})
+    config_a = session_manager.sessions["a"]["session_config"]
+    config_b = session_manager.sessions["b"]["session_config"]
+
+    config_a["session.roles"].append("extra")
+
+    assert "extra" not in config_b["session.roles"]
+    assert "extra" not in session_manager.default_config["session.roles"]
+    assert isinstance(config_b["code_interpreter.allowed_modules"], list)
+    assert config_b["llm.model"] == "other"
+
+
+def test_update_session_config_keeps_default_view_intact(session_manager):
+    session_manager.create_session("a")
+    session_manager.create_session("b")
+
+    session_manager.update_session_config("a", {"session.roles": ["planner"]})
+
+    assert session_manager.get_session_config("a")["session.roles"] == ("planner",)
+    assert session_manager.get_session_config("b")["session.roles"] == (
+        "planner", "code_interpreter", "recepta"
+    )
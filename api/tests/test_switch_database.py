@@ -0,0 +1,42 @@
+import os
+import stat
+
+import pytest
+
+import switch_database
+
+
+@pytest.fixture
+def env_dir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(switch_database, "_env_cache", {"stamp": None, "data": {}})
+    return tmp_path
+
+
+def test_restore_backup_keeps_env_permissions(env_dir):
+    (env_dir / ".env").write_text("DB_CONNECTION_STRING=sqlite:///a.db\n")
+    os.chmod(".env", 0o600)
+    (env_dir / "backup").write_text("DB_CONNECTION_STRING=sqlite:///b.db\n")
+    os.chmod("backup", 0o644)
+
+    assert switch_database.restore_backup("backup")
+
+    assert stat.S_IMODE(os.stat(".env").st_mode) == 0o600
+    assert (env_dir / ".env").read_text() == "DB_CONNECTION_STRING=sqlite:///b.db\n"
+    assert (env_dir / "backup").exists()
+    assert not (env_dir / ".env.tmp").exists()
+
+
+def test_restore_backup_removes_temp_file_on_failure(env_dir, monkeypatch):
+    (env_dir / ".env").write_text("DB_CONNECTION_STRING=sqlite:///a.db\n")
+    (env_dir / "backup").write_text("DB_CONNECTION_STRING=sqlite:///b.db\n")
+
+    def failing_replace(src, dst):
+        raise OSError("replace failed")
+
+    monkeypatch.setattr(switch_database.os, "replace", failing_replace)
+    with pytest.raises(OSError):
+        switch_database.restore_backup("backup")
+
+    assert not (env_dir / ".env.tmp").exists()
+    assert (env_dir / ".env").read_text() == "DB_CONNECTION_STRING=sqlite:///a.db\n"
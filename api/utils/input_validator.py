@@ -1,8 +1,49 @@
 import re
 import html
+from functools import lru_cache
 from typing import Any, Dict, List, Union, Optional
 from fastapi import HTTPException
 
+_UUID_RE = re.compile(r'^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$', re.IGNORECASE)
+_IDENT_RE = re.compile(r'^[a-zA-Z][a-zA-Z0-9_]*$')
+# html.escape 会转义的字符
+_HTML_SPECIAL_CHARS = '&<>"\''
+# 需要移除的控制字符（保留 \t \n \r），用于 str.translate 单次查表删除
+_CONTROL_CHARS_TRANS = dict.fromkeys([*range(0x00, 0x09), 0x0B, 0x0C, *range(0x0E, 0x20), 0x7F])
+
+
+# 标识符（表名/列名）最大长度；UUID 字符串固定长度
+_MAX_IDENT_LEN = 64
+_UUID_LEN = 36
+
+
+def _is_valid_uuid(value: str) -> bool:
+    """检查是否为UUID格式（长度不符的直接拒绝，不进入缓存）"""
+    return len(value) == _UUID_LEN and _match_uuid(value)
+
+
+@lru_cache(maxsize=4096)
+def _match_uuid(value: str) -> bool:
+    """UUID 正则匹配（结果缓存，重复的会话ID只需一次字典查找）"""
+    return _UUID_RE.match(value) is not None
+
+
+def _check_identifier(name: str) -> Optional[str]:
+    """检查表名/列名，返回错误类型（'invalid' 或 'too_long'），合法时返回 None"""
+    # 超长名称不进入缓存，避免任意长的输入长期占用缓存内存
+    if len(name) > _MAX_IDENT_LEN:
+        return 'invalid' if not _IDENT_RE.match(name) else 'too_long'
+    return _check_short_identifier(name)
+
+
+@lru_cache(maxsize=4096)
+def _check_short_identifier(name: str) -> Optional[str]:
+    """检查不超过最大长度的表名/列名（结果缓存）"""
+    # 只允许字母、数字、下划线
+    if not _IDENT_RE.match(name):
+        return 'invalid'
+    return None
+
 class InputValidator:
     """输入验证和清理工具"""
     
@@ -42,6 +83,10 @@ class InputValidator:
         r'\/\*.*\*\/',
     ]
     
+    # 预编译为单个交替正则，每类模式只需扫描一遍输入
+    _DANGEROUS_RE = re.compile("|".join(f"(?:{p})" for p in DANGEROUS_PATTERNS), re.IGNORECASE)
+    _SQL_INJECTION_RE = re.compile("|".join(f"(?:{p})" for p in SQL_INJECTION_PATTERNS), re.IGNORECASE)
+    
     @classmethod
     def sanitize_string(cls, value: str, max_length: int = 1000) -> str:
         """清理字符串输入"""
@@ -52,21 +97,22 @@ class InputValidator:
         if len(value) > max_length:
             raise HTTPException(status_code=400, detail=f"输入长度超过限制 ({max_length} 字符)")
         
-        # HTML编码
-        sanitized = html.escape(value)
+        # HTML编码（不含特殊字符时 html.escape 结果与原串相同，直接跳过）
+        if any(c in value for c in _HTML_SPECIAL_CHARS):
+            sanitized = html.escape(value)
+        else:
+            sanitized = value
         
         # 检查危险模式
-        for pattern in cls.DANGEROUS_PATTERNS:
-            if re.search(pattern, sanitized, re.IGNORECASE):
-                raise HTTPException(status_code=400, detail="输入包含不安全内容")
+        if cls._DANGEROUS_RE.search(sanitized):
+            raise HTTPException(status_code=400, detail="输入包含不安全内容")
         
         # 检查SQL注入模式
-        for pattern in cls.SQL_INJECTION_PATTERNS:
-            if re.search(pattern, sanitized, re.IGNORECASE):
-                raise HTTPException(status_code=400, detail="输入包含可疑的SQL内容")
+        if cls._SQL_INJECTION_RE.search(sanitized):
+            raise HTTPException(status_code=400, detail="输入包含可疑的SQL内容")
         
         # 移除控制字符（保留换行和制表符）
-        sanitized = re.sub(r'[\x00-\x08\x0B\x0C\x0E-\x1F\x7F]', '', sanitized)
+        sanitized = sanitized.translate(_CONTROL_CHARS_TRANS)
         
         return sanitized
     
@@ -77,8 +123,7 @@ class InputValidator:
             raise HTTPException(status_code=400, detail="会话ID不能为空")
         
         # 检查UUID格式
-        uuid_pattern = r'^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$'
-        if not re.match(uuid_pattern, session_id, re.IGNORECASE):
+        if not _is_valid_uuid(session_id):
             raise HTTPException(status_code=400, detail="无效的会话ID格式")
         
         return session_id
@@ -89,10 +134,10 @@ class InputValidator:
         if not table_name:
             raise HTTPException(status_code=400, detail="表名不能为空")
         
-        # 只允许字母、数字、下划线
-        if not re.match(r'^[a-zA-Z][a-zA-Z0-9_]*$', table_name):
+        error = _check_identifier(table_name)
+        if error == 'invalid':
             raise HTTPException(status_code=400, detail="表名格式无效")
-        if len(table_name) > 64:
+        if error == 'too_long':
             raise HTTPException(status_code=400, detail="表名过长")
         
         return table_name
@@ -103,11 +148,10 @@ class InputValidator:
         if not column_name:
             raise HTTPException(status_code=400, detail="列名不能为空")
         
-        # 只允许字母、数字、下划线
-        if not re.match(r'^[a-zA-Z][a-zA-Z0-9_]*$', column_name):
+        error = _check_identifier(column_name)
+        if error == 'invalid':
             raise HTTPException(status_code=400, detail="列名格式无效")
-        
-        if len(column_name) > 64:
+        if error == 'too_long':
             raise HTTPException(status_code=400, detail="列名过长")
         
         return column_name
@@ -118,6 +162,12 @@ class InputValidator:
         if max_depth <= 0:
             return {}
         
+        # 快速路径：键都是普通标识符且值都是数字/布尔时，清理结果与输入相同
+        if all(isinstance(v, (int, float, bool)) for v in data.values()) and all(
+            isinstance(k, str) and len(k) <= 100 and _IDENT_RE.match(k) for k in data
+        ):
+            return dict(data)
+        
         sanitized = {}
         for key, value in data.items():
             # 清理键名
@@ -143,8 +193,13 @@ class InputValidator:
         if max_depth <= 0:
             return []
         
+        # 快速路径：元素都是数字/布尔时无需逐个清理
+        items = data[:100]  # 限制列表长度
+        if all(isinstance(item, (int, float, bool)) for item in items):
+            return items
+        
         sanitized = []
-        for item in data[:100]:  # 限制列表长度
+        for item in items:
             if isinstance(item, str):
                 sanitized.append(cls.sanitize_string(item))
             elif isinstance(item, dict):
@@ -158,6 +213,14 @@ class InputValidator:
         
         return sanitized
 
+# 按参数的精确类型分派清理函数；Request、Pydantic 模型及数字/布尔/None 等
+# 已由 FastAPI 校验或无需清理的类型不在表中，直接透传
+_SANITIZERS = {
+    str: InputValidator.sanitize_string,
+    dict: InputValidator.sanitize_dict,
+    list: InputValidator.sanitize_list,
+}
+
 # 创建装饰器用于自动验证输入
 def validate_input(func):
     """输入验证装饰器"""
@@ -165,26 +228,14 @@ def validate_input(func):
         # 清理所有字符串参数
         clean_args = []
         for arg in args:
-            if isinstance(arg, str):
-                clean_args.append(InputValidator.sanitize_string(arg))
-            elif isinstance(arg, dict):
-                clean_args.append(InputValidator.sanitize_dict(arg))
-            elif isinstance(arg, list):
-                clean_args.append(InputValidator.sanitize_list(arg))
-            else:
-                clean_args.append(arg)
+            sanitizer = _SANITIZERS.get(type(arg))
+            clean_args.append(sanitizer(arg) if sanitizer is not None else arg)
         
         clean_kwargs = {}
         for key, value in kwargs.items():
-            if isinstance(value, str):
-                clean_kwargs[key] = InputValidator.sanitize_string(value)
-            elif isinstance(value, dict):
-                clean_kwargs[key] = InputValidator.sanitize_dict(value)
-            elif isinstance(value, list):
-                clean_kwargs[key] = InputValidator.sanitize_list(value)
-            else:
-                clean_kwargs[key] = value
+            sanitizer = _SANITIZERS.get(type(value))
+            clean_kwargs[key] = sanitizer(value) if sanitizer is not None else value
         
         return func(*clean_args, **clean_kwargs)
     
-    return wrapper
\ No newline at end of file
+    return wrapper
@@ -1,34 +1,130 @@
 import time
-from typing import Dict, Callable
-from collections import defaultdict, deque
+import logging
+import threading
+from typing import Dict, Callable, Optional, Tuple
 from fastapi import HTTPException, Request
 from functools import wraps
 
+logger = logging.getLogger(__name__)
+
 class RateLimiter:
-    """简单的频率限制器"""
+    """简单的频率限制器（滑动窗口计数，每个键只保存两个窗口的计数）"""
     
     def __init__(self):
-        self.requests = defaultdict(deque)
+        # key -> (当前窗口序号, 上一窗口请求数, 当前窗口请求数)
+        self.buckets: Dict[str, Tuple[int, int, int]] = {}
+        self._lock = threading.Lock()
     
     def is_allowed(self, key: str, max_requests: int, window_seconds: int) -> bool:
         """检查是否允许请求"""
         now = time.time()
-        window_start = now - window_seconds
+        bucket_idx = int(now // window_seconds)
+        # 当前窗口已经过的比例，用于按权重折算上一窗口的请求数
+        elapsed_ratio = (now % window_seconds) / window_seconds
         
-        # 清理过期的请求记录
-        while self.requests[key] and self.requests[key][0] < window_start:
-            self.requests[key].popleft()
+        with self._lock:
+            idx, prev_count, curr_count = self.buckets.get(key, (bucket_idx, 0, 0))
+            
+            # 进入新窗口时滚动计数，间隔超过一个窗口则上一窗口计数清零
+            if bucket_idx != idx:
+                prev_count = curr_count if bucket_idx == idx + 1 else 0
+                curr_count = 0
+            
+            # 估算滑动窗口内的请求数
+            estimated = prev_count * (1 - elapsed_ratio) + curr_count
+            if estimated >= max_requests:
+                self.buckets[key] = (bucket_idx, prev_count, curr_count)
+                return False
+            
+            # 记录当前请求
+            self.buckets[key] = (bucket_idx, prev_count, curr_count + 1)
+            return True
+
+class RedisRateLimiter:
+    """基于 Redis 的滑动窗口频率限制器，多个 worker / 实例共享同一份计数
+
+    与进程内 RateLimiter 使用相同的近似算法（上一窗口计数按剩余比例折算 + 当前窗口计数），
+    Redis 不可用回退到进程内计数时限流语义保持一致。
+    """
+    
+    # 读取两个窗口的计数、判断并记录请求在同一脚本内原子完成，每次检查只需一次往返；
+    # 当前窗口的计数还要在下一个窗口中作为"上一窗口"使用，因此保留两个窗口时长
+    _SCRIPT = """
+local prev = tonumber(redis.call('GET', KEYS[2]) or '0')
+local curr = tonumber(redis.call('GET', KEYS[1]) or '0')
+if prev * (1 - tonumber(ARGV[3])) + curr >= tonumber(ARGV[1]) then
+    return 0
+end
+redis.call('INCR', KEYS[1])
+if curr == 0 then
+    redis.call('EXPIRE', KEYS[1], tonumber(ARGV[2]) * 2)
+end
+return 1
+"""
+    # Redis 不可用后暂停使用的时间（秒），期间直接回退到进程内计数
+    RETRY_AFTER_SECONDS = 30
+    # 连接与读写超时（秒）：Redis 挂起时快速失败并回退，而不是阻塞请求
+    SOCKET_TIMEOUT_SECONDS = 0.5
+    
+    def __init__(self, redis_url: str):
+        import redis.asyncio as aioredis
         
-        # 检查当前窗口内的请求数
-        if len(self.requests[key]) >= max_requests:
-            return False
+        self._client = aioredis.from_url(
+            redis_url,
+            socket_timeout=self.SOCKET_TIMEOUT_SECONDS,
+            socket_connect_timeout=self.SOCKET_TIMEOUT_SECONDS,
+        )
+        self._script = self._client.register_script(self._SCRIPT)
+        self._disabled_until = 0.0
+    
+    async def is_allowed(self, key: str, max_requests: int, window_seconds: int) -> Optional[bool]:
+        """检查是否允许请求，Redis 不可用时返回 None"""
+        now = time.time()
+        if now < self._disabled_until:
+            return None
         
-        # 记录当前请求
-        self.requests[key].append(now)
-        return True
+        bucket_idx = int(now // window_seconds)
+        # 当前窗口已经过的比例，用于按权重折算上一窗口的请求数
+        elapsed_ratio = (now % window_seconds) / window_seconds
+        try:
+            result = await self._script(
+                keys=[f"rl:{key}:{bucket_idx}", f"rl:{key}:{bucket_idx - 1}"],
+                args=[max_requests, window_seconds, elapsed_ratio],
+            )
+        except Exception as e:
+            self._disabled_until = now + self.RETRY_AFTER_SECONDS
+            logger.warning(f"Redis频率限制不可用，暂时回退到进程内计数: {e}")
+            return None
+        return bool(result)
 
 # 全局频率限制器实例
 rate_limiter = RateLimiter()
+_redis_rate_limiter: Optional[RedisRateLimiter] = None
+_redis_rate_limiter_initialized = False
+
+def _get_redis_rate_limiter() -> Optional[RedisRateLimiter]:
+    """按配置懒加载 Redis 频率限制器，未配置或缺少 redis 包时返回 None"""
+    global _redis_rate_limiter, _redis_rate_limiter_initialized
+    if not _redis_rate_limiter_initialized:
+        _redis_rate_limiter_initialized = True
+        from config import get_config
+        
+        redis_url = get_config().rate_limit_redis_url
+        if redis_url:
+            try:
+                _redis_rate_limiter = RedisRateLimiter(redis_url)
+            except ImportError:
+                logger.warning("已配置 RATE_LIMIT_REDIS_URL 但未安装 redis 包，使用进程内频率限制")
+    return _redis_rate_limiter
+
+async def _is_allowed(key: str, max_requests: int, window_seconds: int) -> bool:
+    """优先使用 Redis 共享计数，不可用时回退到进程内计数"""
+    redis_limiter = _get_redis_rate_limiter()
+    if redis_limiter is not None:
+        allowed = await redis_limiter.is_allowed(key, max_requests, window_seconds)
+        if allowed is not None:
+            return allowed
+    return rate_limiter.is_allowed(key, max_requests, window_seconds)
 
 def rate_limit(limit_str: str):
     """
@@ -66,7 +162,7 @@ def rate_limit(limit_str: str):
             key = f"{client_ip}:{endpoint}"
             
             # 检查频率限制
-            if not rate_limiter.is_allowed(key, max_requests, window_seconds):
+            if not await _is_allowed(key, max_requests, window_seconds):
                 raise HTTPException(
                     status_code=429,
                     detail=f"请求过于频繁，限制: {limit_str}"
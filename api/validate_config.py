@@ -28,19 +28,26 @@ def validate_environment():
         'CONFIG_DB_PATH',
     ]
     
+    # 一次性读取环境变量快照，并预先确定需要脱敏显示的变量
+    env = dict(os.environ)
+    sensitive_vars = {
+        var for var in required_vars + optional_vars
+        if any(token in var for token in ('KEY', 'PASSWORD', 'SECRET'))
+    }
+    
     errors = []
     warnings = []
     
     # 检查必需变量
     print("\n📋 检查必需的环境变量:")
     for var in required_vars:
-        value = os.getenv(var)
+        value = env.get(var)
         if not value:
             errors.append(f"❌ {var} 未设置")
             print(f"  ❌ {var}: 未设置")
         else:
             # 隐藏敏感信息
-            if 'KEY' in var or 'PASSWORD' in var or 'SECRET' in var:
+            if var in sensitive_vars:
                 display_value = f"{value[:8]}..." if len(value) > 8 else "***"
             else:
                 display_value = value
@@ -49,9 +56,9 @@ def validate_environment():
     # 检查可选变量
     print("\n📋 检查可选的环境变量:")
     for var in optional_vars:
-        value = os.getenv(var)
+        value = env.get(var)
         if value:
-            if 'KEY' in var or 'PASSWORD' in var or 'SECRET' in var:
+            if var in sensitive_vars:
                 display_value = f"{value[:8]}..." if len(value) > 8 else "***"
             else:
                 display_value = value
@@ -64,7 +71,7 @@ def validate_environment():
     print("\n🔍 特殊检查:")
     
     # 检查数据库连接字符串格式
-    db_conn = os.getenv('DB_CONNECTION_STRING')
+    db_conn = env.get('DB_CONNECTION_STRING')
     if db_conn:
         if '://' in db_conn and '@' in db_conn:
             print("  ✅ 数据库连接字符串格式正确")
@@ -73,7 +80,7 @@ def validate_environment():
             print("  ❌ 数据库连接字符串格式可能不正确")
     
     # 检查端口号
-    port = os.getenv('PORT', '8000')
+    port = env.get('PORT', '8000')
     try:
         port_num = int(port)
         if 1 <= port_num <= 65535:
@@ -86,7 +93,7 @@ def validate_environment():
         print(f"  ❌ 端口号不是有效数字: {port}")
     
     # 检查配置数据库文件
-    config_db_path = os.getenv('CONFIG_DB_PATH', 'config_database.db')
+    config_db_path = env.get('CONFIG_DB_PATH', 'config_database.db')
     if os.path.exists(config_db_path):
         print(f"  ✅ 配置数据库文件存在: {config_db_path}")
     else: